@@ -0,0 +1,243 @@
+import argparse
+import glob
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from database import DB_PATH, get_connection, setup_database, to_epoch, from_epoch, local_times, now_epoch
+
+ARCHIVE_DIR = os.path.join('archive', 'stock_data')
+ROW_GROUP_SIZE = 65536
+# Exports hold this lease in crawl_leases, so sharded crawls finishing at the
+# same time export one after the other. It is renewed after every batch.
+EXPORT_LEASE = 'archive:export'
+EXPORT_LEASE_SECONDS = 600
+# The current month is merged once an export leaves more part files than this
+CURRENT_MONTH_PARTS = 24
+COLUMNS = ['stock_id', 'product_id', 'category', 'subcategory', 'product_name', 'date', 'stock_amount', 'price']
+SCHEMA = pa.schema([
+    ('stock_id', pa.int64()),
+    ('product_id', pa.int64()),
+    ('category', pa.string()),
+    ('subcategory', pa.string()),
+    ('product_name', pa.string()),
+    ('date', pa.timestamp('s')),
+    ('stock_amount', pa.int64()),
+    ('price', pa.float64()),
+])
+
+# The archive is a copy of stock_data in Parquet, partitioned as
+# category=<name>/month=<YYYY-MM>/part-<first id>-<last id>.parquet.
+# 'archive_last_id' in scrape_meta is the highest stock_data id exported, so
+# each export only appends the rows scraped since. stock_data itself is left
+# untouched and stays the source of truth.
+
+def get_last_archived_id(conn):
+    row = conn.execute("SELECT value FROM scrape_meta WHERE key = 'archive_last_id'").fetchone()
+    return int(row[0]) if row else 0
+
+def set_last_archived_id(conn, last_id):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO scrape_meta (key, value) VALUES ('archive_last_id', ?)", (str(last_id),))
+
+def acquire_export_lease(conn, owner):
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO crawl_leases (name, expires_at) VALUES (?, 0)', (EXPORT_LEASE,))
+        cursor = conn.execute('''
+            UPDATE crawl_leases SET owner = ?, expires_at = ?
+            WHERE name = ? AND (expires_at < ? OR owner = ?)
+        ''', (owner, now_epoch() + EXPORT_LEASE_SECONDS, EXPORT_LEASE, now_epoch(), owner))
+    return cursor.rowcount == 1
+
+def release_export_lease(conn, owner):
+    with conn:
+        conn.execute('UPDATE crawl_leases SET expires_at = 0 WHERE name = ? AND owner = ?', (EXPORT_LEASE, owner))
+
+def partition_dir(category, month, root=ARCHIVE_DIR):
+    return os.path.join(root, f'category={quote(category, safe="")}', f'month={month}')
+
+# Write every stock_data row not yet archived and return the number written,
+# then merge the part files this leaves behind. File names come from the id
+# range, so re-running after a crash rewrites the same files instead of
+# duplicating rows. A full export (nothing archived yet) starts from an
+# empty directory. When another process is exporting this one skips; its
+# rows are picked up by the next export.
+def export_archive(conn, root=ARCHIVE_DIR, batch_size=200000, log=print):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not acquire_export_lease(conn, owner):
+        log("Another archive export is running, skipping.")
+        return 0
+    try:
+        exported = _export_rows(conn, root, batch_size, log, owner)
+        if exported:
+            compact_archive(root, log, CURRENT_MONTH_PARTS)
+    finally:
+        release_export_lease(conn, owner)
+    return exported
+
+def _export_rows(conn, root, batch_size, log, owner):
+    last_id = get_last_archived_id(conn)
+    if not last_id and os.path.isdir(root):
+        shutil.rmtree(root)
+    exported = 0
+    while True:
+        df = pd.read_sql_query('''
+            SELECT sd.id AS stock_id, sd.product_id, pi.category, pi.subcategory, pi.product_name,
+                sd.date, sd.stock_amount, sd.price
+            FROM stock_data sd
+            JOIN products pi ON pi.id = sd.product_id
+            WHERE sd.id > ?
+            ORDER BY sd.id
+            LIMIT ?
+        ''', conn, params=(last_id, batch_size))
+        if df.empty:
+            break
+        # Partitioned by local month, the same calendar the app filters on
+        dates = local_times(df['date'])
+        df['month'] = dates.dt.year * 100 + dates.dt.month
+        for (category, month), part in df.groupby(['category', 'month']):
+            part = part.sort_values(['product_id', 'date'])
+            directory = partition_dir(category, f'{month // 100:04d}-{month % 100:02d}', root)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{part["stock_id"].min()}-{part["stock_id"].max()}.parquet')
+            table = pa.Table.from_pandas(part[COLUMNS], schema=SCHEMA, preserve_index=False)
+            pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression='zstd')
+        last_id = int(df['stock_id'].max())
+        set_last_archived_id(conn, last_id)
+        acquire_export_lease(conn, owner)
+        exported += len(df)
+    log(f"Archived {exported} new rows to {root} (up to stock_data id {last_id}).")
+    return exported
+
+# Merge the part files of each finished month into one file, so frequent
+# exports do not leave many small files behind. The current month is only
+# merged once it has more than current_month_parts files.
+def compact_archive(root=ARCHIVE_DIR, log=print, current_month_parts=None):
+    current_month = datetime.now().strftime('%Y-%m')
+    compacted = 0
+    for directory in glob.glob(os.path.join(root, 'category=*', 'month=*')):
+        parts = sorted(glob.glob(os.path.join(directory, 'part-*.parquet')))
+        limit = current_month_parts if directory.endswith(f'month={current_month}') else 1
+        if limit is None or len(parts) <= limit:
+            continue
+        df = pd.concat([pd.read_parquet(path) for path in parts]).drop_duplicates('stock_id')
+        df = df.sort_values(['product_id', 'date'])
+        path = os.path.join(directory, f'part-{df["stock_id"].min()}-{df["stock_id"].max()}.parquet')
+        temp_path = path + '.tmp'
+        pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), temp_path,
+                       row_group_size=ROW_GROUP_SIZE, compression='zstd')
+        # Readers drop duplicate stock ids, so briefly seeing both is harmless
+        os.replace(temp_path, path)
+        for part in parts:
+            if part != path:
+                os.remove(part)
+        compacted += 1
+    log(f"Compacted {compacted} partitions.")
+    return compacted
+
+# Start of the month of the oldest row not yet archived. Every row before it
+# is in the archive, so reads take dates before it from Parquet and the rest
+# from SQLite. None when nothing is archived.
+def cold_boundary(conn, root=ARCHIVE_DIR):
+    last_id = get_last_archived_id(conn)
+    if not last_id or not os.path.isdir(root):
+        return None
+    row = conn.execute('SELECT MIN(date) FROM stock_data WHERE id > ?', (last_id,)).fetchone()
+    oldest = from_epoch(row[0]) if row[0] is not None else datetime.now()
+    return to_epoch(oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0))
+
+def partition_files(start, end, categories=None, root=ARCHIVE_DIR):
+    first_month = from_epoch(start).strftime('%Y-%m')
+    last_month = from_epoch(end - 1).strftime('%Y-%m')
+    files = []
+    for directory in glob.glob(os.path.join(root, 'category=*', 'month=*')):
+        category = unquote(os.path.basename(os.path.dirname(directory))[len('category='):])
+        month = os.path.basename(directory)[len('month='):]
+        if categories and category not in categories:
+            continue
+        if first_month <= month <= last_month:
+            files += glob.glob(os.path.join(directory, 'part-*.parquet'))
+    return files
+
+# Archived rows in [start, end) (epoch seconds), reading only the matching
+# partitions and row groups and only the requested columns
+def read_cold(start, end, category=None, subcategory=None, product_name=None, columns=None, root=ARCHIVE_DIR):
+    columns = columns or COLUMNS
+    files = partition_files(start, end, [category] if category else None, root)
+    if not files:
+        return pd.DataFrame(columns=columns)
+    condition = (ds.field('date') >= pa.scalar(start, pa.timestamp('s'))) & (ds.field('date') < pa.scalar(end, pa.timestamp('s')))
+    if subcategory:
+        condition &= ds.field('subcategory') == subcategory
+    if product_name:
+        condition &= ds.field('product_name') == product_name
+    table = ds.dataset(files, schema=SCHEMA, format='parquet').to_table(
+        columns=list(dict.fromkeys(columns + ['stock_id'])), filter=condition
+    )
+    df = table.to_pandas().drop_duplicates('stock_id')[columns]
+    if 'date' in df:
+        df['date'] = local_times((df['date'] - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+    return df
+
+def read_hot(conn, start, end, category=None, subcategory=None, product_name=None, columns=None):
+    columns = columns or COLUMNS
+    where = ['sd.date >= ?', 'sd.date < ?']
+    params = [start, end]
+    for column, value in (('category', category), ('subcategory', subcategory), ('product_name', product_name)):
+        if value:
+            where.append(f'pi.{column} = ?')
+            params.append(value)
+    df = pd.read_sql_query(f'''
+        SELECT sd.id AS stock_id, sd.product_id, pi.category, pi.subcategory, pi.product_name,
+            sd.date, sd.stock_amount, sd.price
+        FROM stock_data sd
+        JOIN products pi ON pi.id = sd.product_id
+        WHERE {' AND '.join(where)}
+    ''', conn, params=params)
+    df['date'] = local_times(df['date'])
+    return df[columns]
+
+# Stock history between two dates, with cold months read from the Parquet
+# archive and recent data from SQLite
+def load_history(conn, start_date, end_date, category=None, subcategory=None, product_name=None, columns=None,
+                 root=ARCHIVE_DIR):
+    start = to_epoch(datetime.combine(start_date, datetime.min.time()))
+    end = to_epoch(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    filters = {'category': category, 'subcategory': subcategory, 'product_name': product_name, 'columns': columns}
+    boundary = cold_boundary(conn, root)
+    frames = []
+    if boundary and start < boundary:
+        frames.append(read_cold(start, min(end, boundary), root=root, **filters))
+    if not boundary or end > boundary:
+        frames.append(read_hot(conn, max(start, boundary or start), end, **filters))
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values('date', kind='stable', ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive stock_data to partitioned Parquet.")
+    parser.add_argument('command', choices=['export', 'compact'], help="export new rows, or merge finished months")
+    parser.add_argument('--root', default=ARCHIVE_DIR, help="Archive directory")
+    args = parser.parse_args()
+
+    conn = get_connection(DB_PATH)
+    setup_database(conn)
+    if args.command == 'export':
+        export_archive(conn, args.root)
+    else:
+        # Under the export lease so it never merges files an export is writing
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        if acquire_export_lease(conn, owner):
+            try:
+                compact_archive(args.root)
+            finally:
+                release_export_lease(conn, owner)
+        else:
+            print("An archive export is running, try again later.")
+    conn.close()
@@ -0,0 +1,77 @@
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from bs4 import BeautifulSoup
+from parsel import Selector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractors import extract_fields
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The BeautifulSoup extraction StockSpider.parse used before extractors.py
+def extract_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+
+    text_div = soup.find('div', class_='text collapse')
+    stock = None
+    if text_div:
+        text_content = text_div.find('p').get_text(strip=True)
+        number_match = re.search(r'\b\d+\b', text_content)
+        if number_match:
+            stock = int(number_match.group(0))
+
+    price_block = soup.find('div', class_='price-block')
+    price = None
+    if price_block:
+        price_span = price_block.find('span', class_='woocommerce-Price-amount amount')
+        if price_span:
+            price_text = price_span.get_text(strip=True)
+            price_match = re.search(r'[\d,]+(?:\.\d{2})?', price_text)
+            if price_match:
+                price = float(price_match.group(0).replace(',', ''))
+
+    return {'stock': stock, 'price': price}
+
+def extract_selector(html):
+    return extract_fields(Selector(text=html), host='verpakgigant.nl')
+
+def bench(func, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            func(html)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BeautifulSoup and selector-based extraction over saved product pages.")
+    parser.add_argument('--fixtures', default=FIXTURES, help="Directory of saved product page HTML files")
+    parser.add_argument('--repeat', type=int, default=50, help="Passes over the fixture set per extractor")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.fixtures, '*.html')))
+    if not paths:
+        sys.exit(f"No HTML fixtures found in {args.fixtures}")
+    pages = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+
+    # Both paths must agree before their timings mean anything
+    for path, html in zip(paths, pages):
+        old, new = extract_bs4(html), extract_selector(html)
+        status = 'ok' if old == new else 'MISMATCH'
+        print(f"{os.path.basename(path)}: bs4={old} selector={new} [{status}]")
+
+    bs4_time = bench(extract_bs4, pages, args.repeat)
+    selector_time = bench(extract_selector, pages, args.repeat)
+    print(f"\n{len(pages)} pages x {args.repeat} passes")
+    print(f"BeautifulSoup: {bs4_time * 1000:.2f} ms/page")
+    print(f"Selectors:     {selector_time * 1000:.2f} ms/page")
+    print(f"Speedup:       {bs4_time / selector_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import migrate, get_version
+from database import to_epoch
+from synth_db import create_database
+
+# Times the Stock Tracker and loader queries against a database in the
+# original schema, upgrades a copy with migrations.py and times the same
+# queries against the migrated schema.
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def legacy_queries(conn, product, start, end):
+    category, subcategory, name, product_id = product
+    return {
+        'product history filter': lambda: conn.execute('''
+            SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount, sd.id
+            FROM product_info pi
+            JOIN stock_data sd ON pi.id = sd.product_id
+            WHERE pi.category = ? AND pi.subcategory = ? AND pi.product_name = ? AND sd.date >= ? AND sd.date < ?
+        ''', (category, subcategory, name, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))).fetchall(),
+        'latest row per product': lambda: conn.execute('''
+            SELECT pi.id, (SELECT MAX(id) FROM stock_data WHERE product_id = pi.id) FROM product_info pi
+        ''').fetchall(),
+        'rows in last 7 days': lambda: conn.execute(
+            'SELECT COUNT(*) FROM stock_data WHERE date >= ?', ((end - timedelta(days=7)).strftime('%Y-%m-%d'),)
+        ).fetchone(),
+        'full load + date parse': lambda: pd.to_datetime(pd.read_sql_query('''
+            SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount
+            FROM product_info pi
+            JOIN stock_data sd ON pi.id = sd.product_id
+        ''', conn)['date']),
+    }
+
+def migrated_queries(conn, product, start, end):
+    category, subcategory, name, product_id = product
+    return {
+        'product history filter': lambda: conn.execute('''
+            SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount, sd.id
+            FROM products pi
+            JOIN stock_data sd ON pi.id = sd.product_id
+            WHERE pi.category = ? AND pi.subcategory = ? AND pi.product_name = ? AND sd.date >= ? AND sd.date < ?
+        ''', (category, subcategory, name, to_epoch(start), to_epoch(end))).fetchall(),
+        'latest row per product': lambda: conn.execute('''
+            SELECT pi.id, (SELECT MAX(id) FROM stock_data WHERE product_id = pi.id) FROM product_info pi
+        ''').fetchall(),
+        'rows in last 7 days': lambda: conn.execute(
+            'SELECT COUNT(*) FROM stock_data WHERE date >= ?', (to_epoch(end - timedelta(days=7)),)
+        ).fetchone(),
+        'full load + date parse': lambda: pd.to_datetime(pd.read_sql_query('''
+            SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount
+            FROM products pi
+            JOIN stock_data sd ON pi.id = sd.product_id
+        ''', conn)['date'], unit='s'),
+    }
+
+def run(queries, repeat):
+    return {name: timed(query, repeat) for name, query in queries.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Query timings before and after the schema migrations.")
+    parser.add_argument('--db', help="Database in the original schema to copy (default: generate a synthetic one)")
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--scrapes', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'product_database.db')
+    try:
+        if args.db:
+            shutil.copy(args.db, path)
+        else:
+            create_database(path, args.products, args.scrapes)
+
+        conn = sqlite3.connect(path)
+        if get_version(conn) != 0:
+            sys.exit("The database is already migrated; pass one in the original schema.")
+        rows = conn.execute('SELECT COUNT(*) FROM stock_data').fetchone()[0]
+        first, last = conn.execute('SELECT MIN(date), MAX(date) FROM stock_data').fetchone()
+        product = conn.execute(
+            'SELECT category, subcategory, product_name, id FROM product_info ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        end = datetime.strptime(last[:10], '%Y-%m-%d') + timedelta(days=1)
+        start = max(datetime.strptime(first[:10], '%Y-%m-%d'), end - timedelta(days=30))
+        print(f"{rows} stock_data rows, window {start.date()} to {end.date()}")
+
+        before = run(legacy_queries(conn, product, start, end), args.repeat)
+
+        migration_start = time.perf_counter()
+        migrate(conn)
+        migration_time = time.perf_counter() - migration_start
+        after = run(migrated_queries(conn, product, start, end), args.repeat)
+        version = get_version(conn)
+        conn.close()
+
+        print(f"Migration to version {version} took {migration_time:.2f}s\n")
+        print(f"{'query':<26}{'before':>12}{'after':>12}{'speedup':>10}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:<26}{before[name] * 1000:>10.2f}ms{after[name] * 1000:>10.2f}ms{speedup:>9.1f}x")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+from synth_db import create_database
+from bench_schema import timed
+from mock_shop import MockShop, start_server
+
+# End-to-end benchmark on a synthetic database: schema migration and rollup
+# build, event detection, the Streamlit data paths (cold and cached), full
+# page renders through Streamlit's headless AppTest, StockSpider.parse over
+# the mock shop's pages, and full and incremental crawls of the mock shop.
+# Every case reports its best time and the peak Python heap (tracemalloc).
+# Results can be saved with --json and compared against an earlier run with
+# --baseline.
+
+PAGES = ['Product Overview', 'Stock Tracker', 'Stock Events', 'Crawl Performance']
+# Slowdown against the baseline reported as a regression, ignoring changes
+# smaller than REGRESSION_MIN_SECONDS that are within timer noise
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_SECONDS = 0.002
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+class Results:
+    def __init__(self, options):
+        self.options = options
+        self.cases = {}
+
+    # Best of repeat runs, then one more run under tracemalloc. Steps that
+    # only do work once (once=True) are timed and traced in a single run.
+    def measure(self, name, func, repeat=1, warm=None, once=False):
+        if once:
+            tracemalloc.start()
+            seconds = timed(func, 1)
+            result = {'seconds': seconds, 'peak_mb': tracemalloc.get_traced_memory()[1] / 1024 / 1024}
+            tracemalloc.stop()
+        else:
+            result = {'seconds': timed(func, repeat), 'peak_mb': peak_memory(func) / 1024 / 1024}
+        if warm:
+            result['warm_seconds'] = timed(warm, repeat)
+        self.add(name, **result)
+
+    def add(self, name, note='', **result):
+        self.cases[name] = result
+        warm = f"{result['warm_seconds'] * 1000:>10.2f}ms" if result.get('warm_seconds') is not None else f"{'':>12}"
+        peak = f"{result['peak_mb']:>9.1f}MB" if result.get('peak_mb') is not None else f"{'':>11}"
+        print(f"{name:<52}{result['seconds'] * 1000:>10.1f}ms{warm}{peak}  {note}".rstrip(), flush=True)
+
+def database_cases(results, repeat):
+    from database import get_connection
+    from migrations import migrate
+    from rollups import refresh_rollup
+    from events import update_events
+
+    conn = get_connection()
+    results.measure('migrate schema', lambda: migrate(conn), once=True)
+    results.measure('rebuild daily rollup', lambda: refresh_rollup(conn), repeat)
+    results.measure('detect events (rebuild)', lambda: update_events(conn, rebuild=True), repeat)
+    conn.close()
+
+# The loaders behind each page. Cold calls go around st.cache_data through
+# __wrapped__; warm calls hit the cache.
+def data_path_cases(results, repeat):
+    import data_access
+
+    version = data_access.data_version()
+    products = data_access.load_products(version)
+    min_date, max_date = data_access.load_date_bounds(version)
+    start_date = max(min_date, max_date - timedelta(days=30))
+    product = products.sample(1, random_state=1).iloc[0]
+    category = product['category']
+
+    cases = [
+        ('data_version', data_access.data_version, ()),
+        ('Stock Tracker: load_products', data_access.load_products, (version,)),
+        ('Stock Tracker: load_date_bounds', data_access.load_date_bounds, (version,)),
+        ('Stock Tracker: load_product_history (30 days)', data_access.load_product_history,
+         (version, category, product['subcategory'], product['product_name'], start_date, max_date)),
+        ('Product Overview: load_rollup_date_range', data_access.load_rollup_date_range, (version,)),
+        ('Product Overview: load_overview_groups', data_access.load_overview_groups, (version, start_date, max_date)),
+        ('Product Overview: load_overview_page (first 50 rows)', data_access.load_overview_page,
+         (version, start_date, max_date)),
+        ('load_history (90 days, one category)', data_access.load_history,
+         (version, max(min_date, max_date - timedelta(days=90)), max_date, category)),
+        ('Stock Events: load_events (7 days)', data_access.load_events,
+         (version, max_date - timedelta(days=7), max_date)),
+        ('Stock Events: load_velocity', data_access.load_velocity, (version,)),
+    ]
+    for name, loader, args in cases:
+        cold = getattr(loader, '__wrapped__', loader)
+        warm = (lambda loader=loader, args=args: loader(*args)) if cold is not loader else None
+        if warm:
+            warm()
+        results.measure(name, lambda cold=cold, args=args: cold(*args), repeat, warm)
+
+# Render each page of main.py headless, first with empty caches, then again
+# with the caches filled by the first render
+def page_cases(results):
+    import streamlit as st
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    for page in PAGES:
+        st.cache_data.clear()
+        app = AppTest.from_file(os.path.join(ROOT, 'main.py'), default_timeout=600)
+        app.run()
+        # AppTest reloads the config, which resets the log level
+        set_log_level('error')
+
+        def render(app=app, page=page):
+            app.sidebar.selectbox[0].select(page).run()
+            if app.exception:
+                raise RuntimeError(f"{page}: {app.exception[0].value}")
+
+        st.cache_data.clear()
+        cold = timed(render, 1)
+        warm = timed(render, 1)
+        st.cache_data.clear()
+        results.add(f"page render: {page}", seconds=cold, warm_seconds=warm, peak_mb=peak_memory(render) / 1024 / 1024)
+
+def parse_case(results, shop, base_url, repeat):
+    from scrapy.http import HtmlResponse, Request
+    from stock_spider import StockSpider
+
+    spider = StockSpider()
+    responses = []
+    for index in range(min(shop.products, 500)):
+        link = f"{base_url}/product/product-{index}/"
+        category, subcategory = shop.placement(index)
+        request = Request(link, meta={'category': category, 'subcategory': subcategory,
+                                      'product_name': f"Product {index}", 'product_link': link})
+        responses.append(HtmlResponse(link, body=shop.product_page(index).encode('utf-8'), encoding='utf-8', request=request))
+
+    def parse_all():
+        for response in responses:
+            list(spider.parse(response))
+
+    seconds = timed(parse_all, repeat)
+    results.add(f"StockSpider.parse (per page, {len(responses)} pages)", seconds=seconds / len(responses),
+                peak_mb=peak_memory(parse_all) / 1024 / 1024)
+
+# Crawl the mock shop in a child process (Scrapy's reactor runs once per
+# process) and report its wall time, peak heap and the stage timings the
+# RunRecorder stored for the run
+def crawl_case(results, name, profile, incremental):
+    command = [sys.executable, os.path.abspath(__file__), '--crawl-child', '--crawl-profile', profile]
+    if incremental:
+        command.append('--incremental')
+    start = time.perf_counter()
+    output = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if output.returncode != 0:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"{name} failed")
+    child = json.loads(output.stdout.strip().splitlines()[-1])
+
+    conn = sqlite3.connect('product_database.db')
+    run_id, pages, pages_per_sec, errors = conn.execute(
+        "SELECT id, pages, pages_per_sec, errors FROM crawl_runs WHERE spider = 'stock_spider' ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    stages = conn.execute(
+        'SELECT stage, p50_seconds, p95_seconds FROM crawl_run_stages WHERE run_id = ?', (run_id,)
+    ).fetchall()
+    conn.close()
+    results.add(name, f"{pages} pages, {pages_per_sec:.1f} pages/sec, {errors} errors", seconds=elapsed,
+                peak_mb=child['peak_mb'], pages=pages, pages_per_sec=pages_per_sec, errors=errors)
+    for stage, p50, p95 in stages:
+        if p50 is not None:
+            results.add(f"  {name} {stage} p50", seconds=p50)
+            results.add(f"  {name} {stage} p95", seconds=p95)
+
+def crawl_child(profile, incremental):
+    from stock_spider import run_spider
+
+    tracemalloc.start()
+    run_spider(None, profile=profile, incremental=incremental)
+    print(json.dumps({'peak_mb': tracemalloc.get_traced_memory()[1] / 1024 / 1024}))
+
+def compare(results, path):
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {path}:")
+    sizes = ['products', 'scrapes', 'screenshots', 'crawl_products', 'crawl_profile', 'latency_ms']
+    changed = [key for key in sizes if baseline['options'].get(key) != results.options.get(key)]
+    if changed:
+        print(f"Warning: the baseline was run with different {', '.join(changed)}")
+    regressions = 0
+    for name, result in results.cases.items():
+        if name not in baseline['cases']:
+            continue
+        before = baseline['cases'][name]['seconds']
+        change = (result['seconds'] - before) / before if before else 0
+        slower = change > REGRESSION_THRESHOLD and result['seconds'] - before > REGRESSION_MIN_SECONDS
+        flag = 'REGRESSION' if slower else ''
+        regressions += bool(flag)
+        print(f"{name:<52}{before * 1000:>10.1f}ms -> {result['seconds'] * 1000:>10.1f}ms {change:>+8.0%} {flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data paths, page renders and crawler on synthetic data.")
+    parser.add_argument('--products', type=int, default=2000, help="Products in the synthetic database")
+    parser.add_argument('--scrapes', type=int, default=360, help="Scrapes per product (360 x 6h = 90 days)")
+    parser.add_argument('--screenshots', action='store_true', help="Store a screenshot BLOB in every row")
+    parser.add_argument('--crawl-products', type=int, default=500, help="Products served by the mock shop")
+    parser.add_argument('--crawl-profile', default='fast')
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay the mock shop adds to each response")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-pages', action='store_true', help="Skip the headless page renders")
+    parser.add_argument('--skip-crawl', action='store_true', help="Skip the mock shop crawls")
+    parser.add_argument('--json', metavar='PATH', help="Save the results to PATH")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare with results saved by an earlier --json run")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directory")
+    parser.add_argument('--crawl-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--incremental', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crawl_child:
+        crawl_child(args.crawl_profile, args.incremental)
+        return
+
+    # Streamlit warns about running without a server on every cached call
+    from streamlit.logger import set_log_level
+    set_log_level('error')
+    warnings.simplefilter('ignore', DeprecationWarning)
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    cwd = os.getcwd()
+    results = Results({key: value for key, value in vars(args).items() if key not in ('json', 'baseline')})
+    try:
+        # The app and the spider use paths relative to the working directory
+        os.chdir(workdir)
+        start = time.perf_counter()
+        create_database('product_database.db', args.products, args.scrapes, screenshots=args.screenshots)
+        rows = args.products * args.scrapes
+        print(f"{args.products} products x {args.scrapes} scrapes ({rows} rows) in {workdir}, "
+              f"generated in {time.perf_counter() - start:.1f}s\n")
+        print(f"{'case':<52}{'time':>12}{'cached':>12}{'peak':>11}")
+
+        database_cases(results, args.repeat)
+        data_path_cases(results, args.repeat)
+        if not args.skip_pages:
+            page_cases(results)
+
+        shop = MockShop(args.crawl_products, latency_ms=args.latency_ms, seed=random.randrange(2 ** 32))
+        server = start_server(shop)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        with open('product_data.json', 'w', encoding='utf-8') as f:
+            json.dump(shop.product_data(base_url), f)
+        parse_case(results, shop, base_url, args.repeat)
+        if not args.skip_crawl:
+            crawl_case(results, 'full crawl', args.crawl_profile, incremental=False)
+            crawl_case(results, 'incremental crawl', args.crawl_profile, incremental=True)
+        server.shutdown()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"\nKept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'options': results.options, 'cases': results.cases}, f, indent=2)
+    if args.baseline and compare(results, args.baseline):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PRODUCTS_PER_PAGE = 24
+
+STOCK_PATTERN = re.compile(r'(<div class="text collapse"[^>]*><p>[^<]*?)\b\d+\b')
+PRICE_PATTERN = re.compile(r'(<div class="price-block">.*?</span>)[\d,]+(?:\.\d{2})?', re.S)
+
+# A local WooCommerce-style shop built from the saved product pages in
+# benchmarks/fixtures, so crawls can be timed without touching the live site.
+# Product i is served at /product/product-<i>/ from one of the fixture pages
+# with its own stock and price; stock goes down a little on every request.
+# Subcategory listings are served at /c/<category>/<subcategory>/page/<n>/
+# with WooCommerce pagination. Responses carry an ETag and honour
+# If-None-Match, so incremental crawls see 304s for unchanged products.
+class MockShop:
+    def __init__(self, products=1000, categories=5, subcategories=6, fixtures=FIXTURES, latency_ms=0,
+                 error_rate=0.0, seed=42):
+        self.products = products
+        self.categories = categories
+        self.subcategories = subcategories
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.templates = []
+        for path in sorted(glob.glob(os.path.join(fixtures, 'product_*.html'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.templates.append(f.read())
+        if not self.templates:
+            raise FileNotFoundError(f"No product page fixtures in {fixtures}")
+        self.stock = [self.rng.randint(0, 30000) for _ in range(products)]
+        self.price = [round(self.rng.uniform(0.5, 150), 2) for _ in range(products)]
+
+    # Same category/subcategory layout as benchmarks/synth_db.py
+    def placement(self, index):
+        return f"Category {index % self.categories}", f"Subcategory {(index // self.categories) % self.subcategories}"
+
+    def product_page(self, index):
+        with self.lock:
+            if self.rng.random() < 0.3:
+                self.stock[index] = max(0, self.stock[index] - self.rng.randint(1, 50))
+            stock, price = self.stock[index], self.price[index]
+        html = self.templates[index % len(self.templates)]
+        html = STOCK_PATTERN.sub(lambda match: f"{match.group(1)}{stock}", html, count=1)
+        return PRICE_PATTERN.sub(lambda match: f"{match.group(1)}{price:.2f}", html, count=1)
+
+    def listing_page(self, category, subcategory, page, base_url):
+        members = [index for index in range(self.products) if self.placement(index) == (category, subcategory)]
+        chunk = members[(page - 1) * PRODUCTS_PER_PAGE:page * PRODUCTS_PER_PAGE]
+        if not chunk:
+            return None
+        items = ''.join(
+            f'<li class="product"><a class="woocommerce-LoopProduct-link" href="{base_url}/product/product-{index}/">'
+            f'<h2 class="woocommerce-loop-product__title">Product {index}</h2></a></li>'
+            for index in chunk
+        )
+        more = len(members) > page * PRODUCTS_PER_PAGE
+        next_link = f'<a class="next page-numbers" href="{self.listing_url(base_url, category, subcategory, page + 1)}">Next</a>' if more else ''
+        return f'<html><body><ul class="products">{items}</ul><nav>{next_link}</nav></body></html>'
+
+    def listing_url(self, base_url, category, subcategory, page=1):
+        category_slug = category.lower().replace(' ', '-')
+        subcategory_slug = subcategory.lower().replace(' ', '-')
+        suffix = f'page/{page}/' if page > 1 else ''
+        return f"{base_url}/c/{category_slug}/{subcategory_slug}/{suffix}"
+
+    # product_data.json pointing every product and listing at this shop
+    def product_data(self, base_url):
+        data = {}
+        for index in range(self.products):
+            category, subcategory = self.placement(index)
+            entry = data.setdefault(category, {}).setdefault(
+                subcategory, {'url': self.listing_url(base_url, category, subcategory), 'products': []}
+            )
+            entry['products'].append({'Name': f"Product {index}", 'link': f"{base_url}/product/product-{index}/"})
+        return data
+
+    def handle(self, path, base_url):
+        match = re.fullmatch(r'/product/product-(\d+)/?', path)
+        if match and int(match.group(1)) < self.products:
+            return self.product_page(int(match.group(1)))
+        match = re.fullmatch(r'/c/category-(\d+)/subcategory-(\d+)/(?:page/(\d+)/)?', path)
+        if match:
+            category, subcategory = f"Category {match.group(1)}", f"Subcategory {match.group(2)}"
+            return self.listing_page(category, subcategory, int(match.group(3) or 1), base_url)
+        return None
+
+def make_handler(shop):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if shop.latency:
+                time.sleep(shop.latency)
+            if shop.error_rate and shop.rng.random() < shop.error_rate:
+                return self.respond(503, b'Service Unavailable')
+            html = shop.handle(self.path, f"http://{self.headers.get('Host')}")
+            if html is None:
+                return self.respond(404, b'Not Found')
+            body = html.encode('utf-8')
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                return self.respond(304, b'', etag)
+            self.respond(200, body, etag)
+
+        def respond(self, status, body, etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Serve the shop in a background thread and return the server; its base URL
+# is http://127.0.0.1:<server.server_port>
+def start_server(shop, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(shop))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock WooCommerce shop built from the saved product pages.")
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--write-data', metavar='PATH', help="Write a product_data.json for the shop to PATH")
+    args = parser.parse_args()
+
+    shop = MockShop(args.products, latency_ms=args.latency_ms, error_rate=args.error_rate)
+    server = start_server(shop, args.port)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    if args.write_data:
+        with open(args.write_data, 'w', encoding='utf-8') as f:
+            json.dump(shop.product_data(base_url), f, indent=2)
+        print(f"Wrote {args.write_data}")
+    print(f"Serving {args.products} products at {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import io
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# Generates a synthetic product_database.db in the original (unversioned)
+# schema: product_info with category/subcategory text and stock_data with
+# TEXT dates, optionally with JPEG screenshot BLOBs in every row. Running the
+# app or migrations.py against it exercises the same upgrade path as a real
+# database.
+
+def make_screenshot(rng, size=(640, 480)):
+    from PIL import Image
+    image = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=70)
+    return buffer.getvalue()
+
+def create_database(path, products=500, scrapes=120, interval_hours=6, categories=5,
+                    subcategories=6, screenshots=False, seed=42):
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE product_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT,
+            subcategory TEXT,
+            product_name TEXT,
+            product_link TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE stock_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            date TEXT,
+            stock_amount INTEGER,
+            price REAL,
+            screenshot BLOB,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+
+    catalogue = []
+    for i in range(products):
+        category = f"Category {i % categories}"
+        subcategory = f"Subcategory {(i // categories) % subcategories}"
+        catalogue.append((category, subcategory, f"Product {i}", f"https://shop.example/product/product-{i}/"))
+    conn.executemany(
+        'INSERT INTO product_info (category, subcategory, product_name, product_link) VALUES (?, ?, ?, ?)', catalogue
+    )
+
+    # Random-walk stock and price per product, one row per product per scrape
+    stock = [rng.randint(0, 30000) for _ in range(products)]
+    price = [round(rng.uniform(0.5, 150), 2) for _ in range(products)]
+    # A handful of distinct images, as identical pages produce identical captures
+    images = [make_screenshot(rng) for _ in range(8)] if screenshots else None
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=interval_hours * scrapes)
+    for scrape in range(scrapes):
+        date = (start + timedelta(hours=interval_hours * scrape)).strftime('%Y-%m-%d %H:%M:%S')
+        rows = []
+        for product_id in range(1, products + 1):
+            index = product_id - 1
+            if rng.random() < 0.05:
+                stock[index] += rng.randint(100, 5000)
+            else:
+                stock[index] = max(0, stock[index] - rng.randint(0, 50))
+            if rng.random() < 0.01:
+                price[index] = round(price[index] * rng.uniform(0.9, 1.1), 2)
+            rows.append((product_id, date, stock[index], price[index], images[rng.randrange(len(images))] if images else None))
+        conn.executemany(
+            'INSERT INTO stock_data (product_id, date, stock_amount, price, screenshot) VALUES (?, ?, ?, ?, ?)', rows
+        )
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product database in the original schema.")
+    parser.add_argument('path', help="Output database path")
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--scrapes', type=int, default=120)
+    parser.add_argument('--interval-hours', type=int, default=6)
+    parser.add_argument('--screenshots', action='store_true', help="Store a JPEG BLOB in every stock_data row")
+    args = parser.parse_args()
+    create_database(args.path, args.products, args.scrapes, args.interval_hours, screenshots=args.screenshots)
+    print(f"Wrote {args.products} products x {args.scrapes} scrapes to {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import scrapy
+import json
+import os
+from datetime import datetime, timedelta
+from database import get_connection, setup_database, get_subcategory_id
+from extractors import extract_listing
+
+DATA_PATH = 'product_data.json'
+
+# Crawls the subcategory listing URLs in product_data.json (following
+# pagination), diffs the products found against product_info and rewrites
+# product_data.json with the live catalogue. Listing pages checked within
+# max_age_hours are reused from listing_state without a request, and older
+# ones are fetched with conditional requests.
+class CatalogueSpider(scrapy.Spider):
+    name = 'catalogue_spider'
+
+    def __init__(self, *args, message_queue=None, max_age_hours=12, **kwargs):
+        super(CatalogueSpider, self).__init__(*args, **kwargs)
+        self.current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.fresh_after = (datetime.now() - timedelta(hours=float(max_age_hours))).strftime('%Y-%m-%d %H:%M:%S')
+        self.message_queue = message_queue
+
+        with open(DATA_PATH, 'r', encoding='utf-8') as f:
+            self.data = json.load(f)
+
+        conn = get_connection()
+        setup_database(conn)
+        self.listing_state = {
+            row[0]: {
+                'etag': row[1],
+                'last_modified': row[2],
+                'products': json.loads(row[3] or '[]'),
+                'next_url': row[4],
+                'checked_at': row[5]
+            }
+            for row in conn.execute('SELECT url, etag, last_modified, products, next_url, checked_at FROM listing_state')
+        }
+        conn.close()
+
+        # (category, subcategory) -> {link: name} in listing order
+        self.found = {}
+        self.visited = {}
+        self.complete = set()
+        self.fetched_pages = {}
+
+    def log_message(self, message):
+        if self.message_queue:
+            self.message_queue.put(message)
+        self.logger.info(message)
+
+    def start_requests(self):
+        self.log_message("Discovering products from category listings...")
+        for category, subcategories in self.data.items():
+            for subcategory, subcategory_data in subcategories.items():
+                if not subcategory_data.get('url'):
+                    continue
+                key = (category, subcategory)
+                self.found[key] = {}
+                self.visited[key] = set()
+                request = self.follow(key, subcategory_data['url'])
+                if request:
+                    yield request
+
+    # Walk the listing chain from url, reusing fresh pages, and return a
+    # request for the first page that needs fetching
+    def follow(self, key, url):
+        while url and url not in self.visited[key]:
+            state = self.listing_state.get(url)
+            if state and state['checked_at'] and state['checked_at'] >= self.fresh_after:
+                self.record_page(key, url, state['products'])
+                url = state['next_url']
+                continue
+            return self.listing_request(key, url, state)
+        self.complete.add(key)
+        return None
+
+    def listing_request(self, key, url, state):
+        headers = {}
+        meta = {'key': key, 'handle_httpstatus_list': [304]}
+        if state:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_listing,
+            errback=self.listing_failed,
+            headers=headers,
+            meta=meta,
+            dont_filter=True
+        )
+
+    def record_page(self, key, url, products):
+        self.visited[key].add(url)
+        for name, link in products:
+            self.found[key].setdefault(link, name)
+
+    def parse_listing(self, response):
+        key = response.meta['key']
+        url = response.request.url
+        if response.status == 304:
+            state = self.listing_state[url]
+            products, next_url = state['products'], state['next_url']
+        else:
+            products, next_url = extract_listing(response)
+        self.record_page(key, url, products)
+        self.fetched_pages[url] = {
+            'category': key[0],
+            'subcategory': key[1],
+            'etag': response.headers.get('ETag', b'').decode('latin-1') or None,
+            'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1') or None,
+            'products': products,
+            'next_url': next_url
+        }
+        request = self.follow(key, next_url)
+        if request:
+            yield request
+
+    def listing_failed(self, failure):
+        key = failure.request.meta['key']
+        self.log_message(f"Listing failed, keeping known products for {key[0]} / {key[1]}: {failure.request.url}")
+
+    def closed(self, reason):
+        conn = get_connection()
+        setup_database(conn)
+        added, removed = update_catalogue(conn, self.found, self.complete, self.fetched_pages, self.current_datetime)
+        write_product_data(conn, self.data, self.complete)
+        conn.close()
+        self.log_message(
+            f"Discovery finished: {len(self.complete)}/{len(self.found)} subcategories complete, "
+            f"{len(self.fetched_pages)} listing pages fetched, {added} products added, {removed} removed."
+        )
+
+# Apply the discovered listings to product_info. Products are only marked
+# inactive for subcategories whose whole listing chain was read.
+def update_catalogue(conn, found, complete, fetched_pages, checked_at):
+    added = removed = 0
+    with conn:
+        conn.executemany('''
+            INSERT INTO listing_state (url, category, subcategory, etag, last_modified, products, next_url, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                category = excluded.category,
+                subcategory = excluded.subcategory,
+                etag = COALESCE(excluded.etag, etag),
+                last_modified = COALESCE(excluded.last_modified, last_modified),
+                products = excluded.products,
+                next_url = excluded.next_url,
+                checked_at = excluded.checked_at
+        ''', [
+            (url, page['category'], page['subcategory'], page['etag'], page['last_modified'],
+             json.dumps(page['products'], ensure_ascii=False), page['next_url'], checked_at)
+            for url, page in fetched_pages.items()
+        ])
+
+        for (category, subcategory), products in found.items():
+            subcategory_id = get_subcategory_id(conn, category, subcategory)
+            known = {
+                link: active
+                for link, active in conn.execute(
+                    'SELECT product_link, active FROM product_info WHERE subcategory_id = ?', (subcategory_id,)
+                )
+            }
+            new = [link for link in products if known.get(link) != 1]
+            added += len(new)
+            conn.executemany('''
+                INSERT INTO product_info (subcategory_id, product_name, product_link, active, last_seen)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (product_link) DO UPDATE SET
+                    subcategory_id = excluded.subcategory_id,
+                    product_name = excluded.product_name,
+                    active = 1,
+                    last_seen = excluded.last_seen
+            ''', [(subcategory_id, name, link, checked_at) for link, name in products.items()])
+
+            if (category, subcategory) in complete:
+                gone = [link for link, active in known.items() if active != 0 and link not in products]
+                removed += len(gone)
+                conn.executemany('UPDATE product_info SET active = 0 WHERE product_link = ?', [(link,) for link in gone])
+    return added, removed
+
+# Rewrite product_data.json with the active products of each subcategory
+def write_product_data(conn, data, complete, path=DATA_PATH):
+    for category, subcategories in data.items():
+        for subcategory, subcategory_data in subcategories.items():
+            rows = conn.execute('''
+                SELECT product_name, product_link FROM products
+                WHERE category = ? AND subcategory = ? AND active = 1
+                ORDER BY id
+            ''', (category, subcategory)).fetchall()
+            if rows or (category, subcategory) in complete:
+                subcategory_data['products'] = [{'Name': name, 'link': link} for name, link in rows]
+    # Write to a temporary file and swap it in, so crawls starting meanwhile
+    # never read a half-written catalogue
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
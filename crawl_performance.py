@@ -0,0 +1,95 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from data_access import load_runs, load_run_stages, load_run_timings
+
+STAGES = ['download', 'parse', 'screenshot', 'db_write']
+SLOWEST_PRODUCTS = 20
+
+def format_value(value, pattern='{:.0f}'):
+    return '-' if value is None or pd.isna(value) else pattern.format(value)
+
+def run_label(run):
+    return f"Run {run['id']} - {run['spider']} ({run['profile']}) {run['started']:%Y-%m-%d %H:%M}"
+
+def main():
+    st.title('Crawl Performance')
+
+    runs = load_runs()
+    if runs.empty:
+        st.info('No crawl runs recorded yet. Timings are recorded for every scraper run.')
+        return
+    stages = load_run_stages(tuple(int(run_id) for run_id in runs['id']))
+
+    # Trends across runs: throughput and per-stage latency
+    st.subheader('Trends Across Runs')
+    finished = runs[runs['finished_at'].notna()].sort_values('started')
+    col1, col2 = st.columns(2)
+    throughput_fig = px.line(finished, x='started', y='pages_per_sec', color='spider', markers=True,
+                             title='Throughput', labels={'started': 'Run start', 'pages_per_sec': 'Pages/sec'})
+    col1.plotly_chart(throughput_fig)
+    if not stages.empty:
+        trend = stages.merge(runs[['id', 'started']], left_on='run_id', right_on='id').sort_values('started')
+        trend['p95_ms'] = trend['p95_seconds'] * 1000
+        latency_fig = px.line(trend, x='started', y='p95_ms', color='stage', markers=True,
+                              title='p95 latency per stage', labels={'started': 'Run start', 'p95_ms': 'p95 (ms)'})
+        col2.plotly_chart(latency_fig)
+
+    st.dataframe(runs[['id', 'job_id', 'spider', 'profile', 'reason', 'pages', 'items', 'errors', 'retries',
+                       'elapsed', 'pages_per_sec', 'started']].round({'elapsed': 1, 'pages_per_sec': 2}), hide_index=True)
+
+    # One run in detail
+    run_ids = runs['id'].tolist()
+    run_id = st.selectbox('Run', run_ids, format_func=lambda value: run_label(runs[runs['id'] == value].iloc[0]))
+    run = runs[runs['id'] == run_id].iloc[0]
+    st.subheader(run_label(run))
+    if pd.isna(run['finished_at']):
+        st.info('This run is still going; figures are updated as it records timings.')
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric('Pages', format_value(run['pages']))
+    col2.metric('Pages/sec', format_value(run['pages_per_sec'], '{:.2f}'))
+    col3.metric('Errors', format_value(run['errors']))
+    col4.metric('Elapsed', format_value(run['elapsed'], '{:.1f}s'))
+
+    # Where the time goes: totals and percentiles per stage
+    run_stages = stages[stages['run_id'] == run_id]
+    if not run_stages.empty:
+        summary = run_stages.set_index('stage').reindex([stage for stage in STAGES if stage in set(run_stages['stage'])])
+        summary['share_pct'] = summary['total_seconds'] / summary['total_seconds'].sum() * 100
+        for column in ['mean_seconds', 'p50_seconds', 'p95_seconds', 'max_seconds']:
+            summary[column.replace('_seconds', '_ms')] = summary[column] * 1000
+        st.dataframe(summary[['count', 'errors', 'total_seconds', 'share_pct', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms']].round(1))
+
+    timings = load_run_timings(int(run_id), None if pd.isna(run['finished_at']) else int(run['finished_at']))
+    if timings.empty:
+        st.warning('No request timings for this run. Timings are kept for the most recent runs only.')
+        return
+
+    ok = timings[timings['error'].isna()].copy()
+    ok['product_name'] = ok['product_name'].fillna('')
+    ok['ms'] = ok['seconds'] * 1000
+    histogram = px.histogram(ok, x='ms', facet_col='stage', facet_col_wrap=2, nbins=50,
+                             category_orders={'stage': STAGES}, title='Latency per stage',
+                             labels={'ms': 'Latency (ms)'})
+    histogram.update_xaxes(matches=None, showticklabels=True)
+    histogram.update_yaxes(matches=None)
+    st.plotly_chart(histogram)
+
+    # Products whose pages took longest end to end (download, parse and screenshot)
+    st.subheader('Slowest Products')
+    per_page = ok[ok['url'].notna()].groupby(['url', 'product_name', 'stage'])['ms'].sum().unstack(fill_value=0)
+    if not per_page.empty:
+        per_page['total_ms'] = per_page.sum(axis=1)
+        slowest = per_page.sort_values('total_ms', ascending=False).head(SLOWEST_PRODUCTS).reset_index()
+        st.dataframe(slowest.round(1), hide_index=True)
+
+    st.subheader('Failures')
+    failures = timings[timings['error'].notna()]
+    if failures.empty:
+        st.success('No failed requests in this run.')
+    else:
+        st.dataframe(failures[['recorded_at', 'stage', 'product_name', 'url', 'status', 'error']], hide_index=True)
+
+if __name__ == "__main__":
+    main()
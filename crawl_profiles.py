@@ -0,0 +1,131 @@
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.extensions.throttle import AutoThrottle
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36'
+
+# Crawl profiles. concurrency_per_domain caps parallel requests to one host,
+# min_delay/start_delay/max_delay bound the AutoThrottle delay and
+# target_concurrency is the average number of requests AutoThrottle aims to
+# keep in flight per host based on observed latency.
+CRAWL_PROFILES = {
+    'gentle': {
+        'concurrency_per_domain': 1,
+        'target_concurrency': 1.0,
+        'min_delay': 2,
+        'start_delay': 2,
+        'max_delay': 30,
+        'retry_times': 3,
+        'backoff_base': 5,
+        'backoff_max': 120,
+        'screenshot_workers': 1,
+    },
+    'default': {
+        'concurrency_per_domain': 4,
+        'target_concurrency': 2.0,
+        'min_delay': 0.25,
+        'start_delay': 1,
+        'max_delay': 20,
+        'retry_times': 3,
+        'backoff_base': 2,
+        'backoff_max': 60,
+        'screenshot_workers': 2,
+    },
+    'fast': {
+        'concurrency_per_domain': 8,
+        'target_concurrency': 4.0,
+        'min_delay': 0,
+        'start_delay': 0.5,
+        'max_delay': 10,
+        'retry_times': 5,
+        'backoff_base': 1,
+        'backoff_max': 30,
+        'screenshot_workers': 4,
+    },
+}
+
+RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408]
+
+# Build the Scrapy settings for a profile name or a profile dict
+def get_crawl_settings(profile='default'):
+    name = profile if isinstance(profile, str) else 'custom'
+    if isinstance(profile, str):
+        if profile not in CRAWL_PROFILES:
+            raise ValueError(f"Unknown crawl profile: {profile}")
+        profile = CRAWL_PROFILES[profile]
+    profile = {**CRAWL_PROFILES['default'], **profile}
+
+    return {
+        'CRAWL_PROFILE': name,
+        'USER_AGENT': USER_AGENT,
+        'CONCURRENT_REQUESTS': profile['concurrency_per_domain'] * 4,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': profile['concurrency_per_domain'],
+        'DOWNLOAD_DELAY': profile['min_delay'],
+        'AUTOTHROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_START_DELAY': profile['start_delay'],
+        'AUTOTHROTTLE_MAX_DELAY': profile['max_delay'],
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': profile['target_concurrency'],
+        'RETRY_ENABLED': True,
+        'RETRY_TIMES': profile['retry_times'],
+        'RETRY_HTTP_CODES': RETRY_HTTP_CODES,
+        'BACKOFF_BASE_DELAY': profile['backoff_base'],
+        'BACKOFF_MAX_DELAY': profile['backoff_max'],
+        'SCREENSHOT_WORKERS': profile['screenshot_workers'],
+        'DB_BATCH_SIZE': 50,
+        'ARCHIVE_EXPORT': True,
+        'ITEM_PIPELINES': {
+            'pipelines.SQLiteWriterPipeline': 300,
+        },
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            'crawl_profiles.BackoffRetryMiddleware': 550,
+        },
+        'EXTENSIONS': {
+            'scrapy.extensions.throttle.AutoThrottle': None,
+            'crawl_profiles.NotModifiedAutoThrottle': 0,
+            'crawl_stats.CrawlSummary': 500,
+            'crawl_stats.JobProgress': 510,
+            'crawl_stats.RunRecorder': 520,
+        },
+        'JOB_PROGRESS_INTERVAL': 1.0,
+        'TIMINGS_FLUSH_INTERVAL': 5.0,
+    }
+
+# AutoThrottle only lowers the delay after 200 responses. Incremental crawls
+# are answered mostly with 304 Not Modified, which would leave the delay at
+# AUTOTHROTTLE_START_DELAY for the whole crawl, so a 304 counts as a 200.
+class NotModifiedAutoThrottle(AutoThrottle):
+    def _adjust_delay(self, slot, latency, response):
+        if response.status == 304:
+            response = response.replace(status=200)
+        super(NotModifiedAutoThrottle, self)._adjust_delay(slot, latency, response)
+
+# Retry middleware that also slows the host down on 429/5xx responses.
+# The download slot delay is raised exponentially with the retry count (or to
+# the server's Retry-After), and AutoThrottle brings it back down once
+# responses succeed again.
+class BackoffRetryMiddleware(RetryMiddleware):
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = super(BackoffRetryMiddleware, cls).from_crawler(crawler)
+        middleware.crawler = crawler
+        middleware.base_delay = crawler.settings.getfloat('BACKOFF_BASE_DELAY', 2)
+        middleware.max_delay = crawler.settings.getfloat('BACKOFF_MAX_DELAY', 60)
+        return middleware
+
+    def process_response(self, request, response, spider):
+        if response.status in self.retry_http_codes and not request.meta.get('dont_retry', False):
+            self.backoff(request, response, spider)
+        return super(BackoffRetryMiddleware, self).process_response(request, response, spider)
+
+    def backoff(self, request, response, spider):
+        retries = request.meta.get('retry_times', 0)
+        delay = self.base_delay * (2 ** retries)
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.strip().isdigit():
+            delay = max(delay, int(retry_after.strip()))
+        delay = min(delay, self.max_delay)
+
+        slot = self.crawler.engine.downloader.slots.get(request.meta.get('download_slot'))
+        if slot and slot.delay < delay:
+            slot.delay = delay
+            spider.logger.info(f"Backing off {request.meta.get('download_slot')} for {delay:.1f}s after HTTP {response.status}")
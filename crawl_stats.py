@@ -0,0 +1,264 @@
+import threading
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from database import get_connection, now_epoch
+from jobs import mark_running, report_progress, get_errors
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = (len(values) - 1) * pct / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+# Scrapy extension that records download latency for every response and
+# reports pages/sec, p50/p95 latency and retries when the spider closes.
+class CrawlSummary:
+    def __init__(self, stats):
+        self.stats = stats
+        self.latencies = []
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler.stats)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.started = time.monotonic()
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        pages = len(self.latencies)
+        return {
+            'pages': pages,
+            'elapsed': elapsed,
+            'pages_per_sec': pages / elapsed if elapsed else 0,
+            'p50_latency': percentile(self.latencies, 50),
+            'p95_latency': percentile(self.latencies, 95),
+            'retries': self.stats.get_value('retry/count', 0),
+            'retries_exhausted': self.stats.get_value('retry/max_reached', 0),
+        }
+
+    def spider_closed(self, spider, reason):
+        summary = self.summary()
+        for key, value in summary.items():
+            self.stats.set_value(f'summary/{key}', value)
+
+        if summary['pages']:
+            message = (
+                f"Crawl summary: {summary['pages']} pages in {summary['elapsed']:.1f}s "
+                f"({summary['pages_per_sec']:.2f} pages/sec), "
+                f"latency p50 {summary['p50_latency'] * 1000:.0f}ms / p95 {summary['p95_latency'] * 1000:.0f}ms, "
+                f"{summary['retries']} retries ({summary['retries_exhausted']} gave up)"
+            )
+        else:
+            message = f"Crawl summary: no pages downloaded, {summary['retries']} retries"
+
+        if hasattr(spider, 'log_message'):
+            spider.log_message(message)
+        else:
+            spider.logger.info(message)
+
+# Scrapy extension that reports progress of a background crawl job (the
+# JOB_ID setting) into its crawl_jobs row every JOB_PROGRESS_INTERVAL seconds,
+# and closes the spider when the job is cancelled. Spiders with a total
+# attribute report items done out of total with an ETA, others report pages.
+class JobProgress:
+    def __init__(self, crawler, job_id, interval):
+        self.crawler = crawler
+        self.job_id = job_id
+        self.interval = interval
+        self.conn = None
+        self.loop = None
+        self.spider = None
+        self.started = None
+        self.previous_errors = 0
+        self.closing = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        job_id = crawler.settings.getint('JOB_ID')
+        if not job_id:
+            raise NotConfigured
+        extension = cls(crawler, job_id, crawler.settings.getfloat('JOB_PROGRESS_INTERVAL', 1.0))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.engine_stopped, signal=signals.engine_stopped)
+        return extension
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started = time.monotonic()
+        self.conn = get_connection()
+        mark_running(self.conn, self.job_id)
+        # Errors from an earlier crawl in the same job (catalogue discovery)
+        self.previous_errors = get_errors(self.conn, self.job_id)
+        # Keep reporting until the engine stops, so the job stays alive while
+        # screenshots drain after the spider closes
+        self.loop = task.LoopingCall(self.report)
+        self.loop.start(self.interval, now=False)
+
+    def progress(self):
+        stats = self.crawler.stats
+        errors = stats.get_value('log_count/ERROR', 0) + stats.get_value('httperror/response_ignored_count', 0)
+        total = getattr(self.spider, 'total', None)
+        if total:
+            done = min(total, stats.get_value('item_scraped_count', 0) + errors)
+        else:
+            done = stats.get_value('response_received_count', 0)
+        elapsed = time.monotonic() - self.started
+        eta = (total - done) * elapsed / done if total and done else None
+        return done, total, self.previous_errors + errors, eta
+
+    def report(self):
+        done, total, errors, eta = self.progress()
+        status = report_progress(self.conn, self.job_id, self.spider.name, done, total, errors, eta)
+        if status == 'cancelling' and not self.closing:
+            self.closing = True
+            self.spider.logger.info("Job cancelled, closing spider")
+            self.crawler.engine.close_spider(self.spider, 'cancelled')
+
+    def spider_closed(self, spider, reason):
+        self.closing = True
+        self.report()
+
+    def engine_stopped(self):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        if self.conn:
+            self.report()
+            self.conn.close()
+            self.conn = None
+
+# Timings of this many recent runs are kept; older runs keep only their
+# per-stage aggregates in crawl_run_stages
+TIMING_RUNS_KEPT = 50
+
+# Scrapy extension that records a crawl_runs row for every spider run and
+# the time each request spent in each stage: download (from the response
+# signal), parse (timed by the spider), screenshot (the browser pool) and
+# db_write (per pipeline batch). The spider and its helpers report through
+# spider.timings.record(), which is safe to call from worker threads; rows
+# are written every TIMINGS_FLUSH_INTERVAL seconds and when the engine stops.
+class RunRecorder:
+    def __init__(self, crawler, interval):
+        self.crawler = crawler
+        self.interval = interval
+        self.conn = None
+        self.loop = None
+        self.run_id = None
+        self.started = None
+        self.reason = None
+        self.lock = threading.Lock()
+        self.buffer = []
+        # stage -> [(seconds, failed)] of every timing, for the run aggregates
+        self.stages = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler, crawler.settings.getfloat('TIMINGS_FLUSH_INTERVAL', 5.0))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.spider_error, signal=signals.spider_error)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.engine_stopped, signal=signals.engine_stopped)
+        return extension
+
+    def spider_opened(self, spider):
+        self.started = time.monotonic()
+        self.conn = get_connection()
+        with self.conn:
+            cursor = self.conn.execute('''
+                INSERT INTO crawl_runs (job_id, spider, profile, started_at) VALUES (?, ?, ?, ?)
+            ''', (self.crawler.settings.getint('JOB_ID') or None, spider.name,
+                  self.crawler.settings.get('CRAWL_PROFILE'), now_epoch()))
+        self.run_id = cursor.lastrowid
+        spider.timings = self
+        self.loop = task.LoopingCall(self.flush)
+        self.loop.start(self.interval, now=False)
+
+    def record(self, stage, url, seconds, status='ok', error=None, items=1):
+        with self.lock:
+            self.buffer.append((self.run_id, stage, url, seconds, status, error, items, now_epoch()))
+            self.stages.setdefault(stage, []).append((seconds, error is not None))
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            error = f"HTTP {response.status}" if response.status >= 400 else None
+            self.record('download', response.url, latency, str(response.status), error)
+
+    def spider_error(self, failure, response, spider):
+        self.record('parse', response.url, 0.0, 'error', failure.getErrorMessage())
+
+    def flush(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        if rows and self.conn:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO crawl_timings (run_id, stage, url, seconds, status, error, items, recorded_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+
+    def spider_closed(self, spider, reason):
+        self.reason = reason
+
+    # Per-stage count, errors and latency percentiles of the run; failed
+    # requests are counted but left out of the latencies
+    def stage_summary(self):
+        with self.lock:
+            stages = {stage: list(values) for stage, values in self.stages.items()}
+        for stage, values in stages.items():
+            seconds = [value for value, failed in values if not failed]
+            yield (
+                self.run_id, stage, len(values), sum(failed for _, failed in values), sum(seconds),
+                sum(seconds) / len(seconds) if seconds else None, percentile(seconds, 50),
+                percentile(seconds, 95), max(seconds) if seconds else None
+            )
+
+    # Screenshots drain after the spider closes, so the run is only
+    # finalized once the engine has stopped
+    def engine_stopped(self):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        if not self.conn:
+            return
+        self.flush()
+        stats = self.crawler.stats
+        elapsed = time.monotonic() - self.started
+        pages = stats.get_value('response_received_count', 0)
+        with self.conn:
+            self.conn.execute('''
+                UPDATE crawl_runs SET reason = ?, pages = ?, items = ?, errors = ?, retries = ?, elapsed = ?,
+                    pages_per_sec = ?, finished_at = ?
+                WHERE id = ?
+            ''', (
+                self.reason, pages, stats.get_value('item_scraped_count', 0),
+                stats.get_value('log_count/ERROR', 0) + stats.get_value('httperror/response_ignored_count', 0),
+                stats.get_value('retry/count', 0), elapsed, pages / elapsed if elapsed else 0,
+                now_epoch(), self.run_id
+            ))
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO crawl_run_stages
+                    (run_id, stage, count, errors, total_seconds, mean_seconds, p50_seconds, p95_seconds, max_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', list(self.stage_summary()))
+            self.conn.execute('''
+                DELETE FROM crawl_timings WHERE run_id NOT IN (SELECT id FROM crawl_runs ORDER BY id DESC LIMIT ?)
+            ''', (TIMING_RUNS_KEPT,))
+        self.conn.close()
+        self.conn = None
@@ -0,0 +1,252 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from queue import Queue, Empty
+import pandas as pd
+import streamlit as st
+from database import DB_PATH, get_connection, setup_database, get_last_scrape, to_epoch, from_epoch, local_times
+from rollups import ensure_rollup, rollup_date_range, query_overview, overview_groups
+from archive import load_history as load_archived_history
+from screenshot_store import STORE_PATH, get_store_connection, get_screenshot as get_stored_screenshot, get_thumbnails
+
+# A small pool of read connections shared by every Streamlit session. Each
+# query borrows a connection, so sessions never share one concurrently.
+class ConnectionPool:
+    def __init__(self, connect, size=4):
+        self.connect = connect
+        self.size = size
+        self.created = 0
+        self.lock = threading.Lock()
+        self.idle = Queue()
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            conn = self.connect() if create else self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+def _read_connection(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+@st.cache_resource
+def get_pool(path=DB_PATH):
+    # Create any missing tables and the overview rollup once per process
+    conn = get_connection(path)
+    setup_database(conn)
+    ensure_rollup(conn)
+    conn.close()
+    return ConnectionPool(lambda: _read_connection(path))
+
+@st.cache_resource
+def get_store_pool(path=STORE_PATH):
+    return ConnectionPool(lambda: get_store_connection(path))
+
+# Version stamp of the last finished scrape. Cached results are keyed on it,
+# so they are reused until a crawl writes new data.
+def data_version():
+    with get_pool().connection() as conn:
+        return get_last_scrape(conn) or ''
+
+def _query(query, params=()):
+    with get_pool().connection() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+# Epoch bounds of the half-open range [start_date, end_date + 1 day)
+def _epoch_range(start_date, end_date):
+    start = to_epoch(datetime.combine(start_date, datetime.min.time()))
+    end = to_epoch(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+# Stock rows plus the rows carried forward to each product's last incremental
+# check, with the filters pushed into both halves of the union.
+# screenshot_hash is '' for screenshots still stored inline in stock_data and
+# NULL when the row has none.
+def _history_query(where):
+    screenshot = "COALESCE(sd.screenshot_hash, CASE WHEN sd.screenshot IS NOT NULL THEN '' END)"
+    return f'''
+    SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount, sd.id as stock_id,
+        {screenshot} AS screenshot_hash
+    FROM products pi
+    JOIN stock_data sd ON pi.id = sd.product_id
+    WHERE {where.format(date='sd.date')}
+    UNION ALL
+    SELECT pi.category, pi.subcategory, pi.product_name, sd.price, cs.checked_at, sd.stock_amount, sd.id,
+        {screenshot}
+    FROM crawl_state cs
+    JOIN products pi ON pi.id = cs.product_id
+    JOIN stock_data sd ON sd.id = (SELECT MAX(id) FROM stock_data WHERE product_id = cs.product_id)
+    WHERE cs.checked_at > sd.date AND {where.format(date='cs.checked_at')}
+    '''
+
+# Category, subcategory and product names with each product's highest stock,
+# used to order the sidebar selectors
+@st.cache_data(max_entries=8)
+def load_products(version):
+    return _query('''
+    SELECT pi.category, pi.subcategory, pi.product_name, MAX(sd.stock_amount) AS max_stock
+    FROM products pi
+    JOIN stock_data sd ON pi.id = sd.product_id
+    GROUP BY pi.id
+    ''')
+
+@st.cache_data(max_entries=8)
+def load_date_bounds(version):
+    with get_pool().connection() as conn:
+        row = conn.execute('''
+            SELECT MIN(date), MAX(date) FROM (
+                SELECT date FROM stock_data
+                UNION ALL
+                SELECT checked_at FROM crawl_state
+            )
+        ''').fetchone()
+    if row[0] is None:
+        return None, None
+    return from_epoch(row[0]).date(), from_epoch(row[1]).date()
+
+@st.cache_data(max_entries=64)
+def load_product_history(version, category, subcategory, product_name, start_date, end_date):
+    where = 'pi.category = ? AND pi.subcategory = ? AND pi.product_name = ? AND {date} >= ? AND {date} < ?'
+    params = (category, subcategory, product_name) + _epoch_range(start_date, end_date)
+    df = _query(_history_query(where) + ' ORDER BY date', params + params)
+    df['date'] = local_times(df['date'])
+    return df
+
+# Stock history over a date range for bulk analysis, with months already
+# exported by archive.py read from Parquet and recent data from SQLite
+@st.cache_data(max_entries=8)
+def load_history(version, start_date, end_date, category=None, subcategory=None, product_name=None):
+    with get_pool().connection() as conn:
+        return load_archived_history(conn, start_date, end_date, category, subcategory, product_name)
+
+@st.cache_data(max_entries=8)
+def load_rollup_date_range(version):
+    with get_pool().connection() as conn:
+        min_day, max_day = rollup_date_range(conn)
+    if min_day is None:
+        return None, None
+    return datetime.strptime(min_day, '%Y-%m-%d').date(), datetime.strptime(max_day, '%Y-%m-%d').date()
+
+# One sorted, filtered page of the Product Overview grid. filters is a tuple
+# of (name, value) pairs so it can be part of the cache key.
+@st.cache_data(max_entries=64)
+def load_overview_page(version, start_date, end_date, filters=(), sort=None, descending=True, page=1, page_size=50):
+    with get_pool().connection() as conn:
+        return query_overview(conn, start_date, end_date, dict(filters), sort, descending, page, page_size)
+
+@st.cache_data(max_entries=32)
+def load_overview_groups(version, start_date, end_date, filters=(), level='category'):
+    with get_pool().connection() as conn:
+        return overview_groups(conn, start_date, end_date, dict(filters), level)
+
+# Events recorded by events.py in a date range, newest first
+@st.cache_data(max_entries=32)
+def load_events(version, start_date, end_date, event_types=(), category=None):
+    where = ['se.date >= ?', 'se.date < ?']
+    params = list(_epoch_range(start_date, end_date))
+    if event_types:
+        where.append(f"se.event_type IN ({','.join('?' * len(event_types))})")
+        params += list(event_types)
+    if category:
+        where.append('pi.category = ?')
+        params.append(category)
+    df = _query(f'''
+    SELECT se.date, se.event_type, pi.category, pi.subcategory, pi.product_name,
+        se.previous_value, se.value, se.change, CAST(se.change_pct AS REAL) AS change_pct
+    FROM stock_events se
+    JOIN products pi ON pi.id = se.product_id
+    WHERE {' AND '.join(where)}
+    ORDER BY se.date DESC
+    ''', params)
+    df['date'] = local_times(df['date'])
+    return df
+
+# Units sold per day over each product's last week and days of stock left.
+# Both are NULL for products with a single scrape in the window; the casts
+# keep the columns numeric when every row is NULL.
+@st.cache_data(max_entries=8)
+def load_velocity(version, category=None):
+    where, params = ('WHERE pi.category = ?', (category,)) if category else ('', ())
+    return _query(f'''
+    SELECT pi.category, pi.subcategory, pi.product_name, pv.current_stock,
+        CAST(pv.units_per_day AS REAL) AS units_per_day, CAST(pv.days_of_cover AS REAL) AS days_of_cover
+    FROM product_velocity pv
+    JOIN products pi ON pi.id = pv.product_id
+    {where}
+    ORDER BY pv.units_per_day DESC
+    ''', params)
+
+# Recent spider runs recorded by crawl_stats.RunRecorder. Runs finish after
+# the scrape stamp is written, so these are cached for a few seconds instead
+# of on data_version.
+@st.cache_data(ttl=10)
+def load_runs(limit=100):
+    df = _query('SELECT * FROM crawl_runs ORDER BY id DESC LIMIT ?', (limit,))
+    df['started'] = local_times(df['started_at'])
+    return df
+
+# Per-stage latency aggregates of the given runs
+@st.cache_data(ttl=10)
+def load_run_stages(run_ids):
+    if not run_ids:
+        return pd.DataFrame(columns=['run_id', 'stage'])
+    return _query(f"SELECT * FROM crawl_run_stages WHERE run_id IN ({','.join('?' * len(run_ids))})", run_ids)
+
+# Every timing of one run, with the product name for product pages
+def _run_timings(run_id):
+    df = _query('''
+    SELECT ct.stage, ct.url, ct.seconds, ct.status, ct.error, ct.items, ct.recorded_at, pi.product_name
+    FROM crawl_timings ct
+    LEFT JOIN products pi ON pi.product_link = ct.url
+    WHERE ct.run_id = ?
+    ''', (run_id,))
+    df['recorded_at'] = local_times(df['recorded_at'])
+    return df
+
+@st.cache_data(max_entries=8)
+def _finished_run_timings(run_id, finished_at):
+    return _run_timings(run_id)
+
+# A finished run no longer changes, so it is cached on its finish time. A
+# run that is still going is read on every call so its figures keep up.
+def load_run_timings(run_id, finished_at=None):
+    if finished_at is None:
+        return _run_timings(run_id)
+    return _finished_run_timings(run_id, finished_at)
+
+# Thumbnails are immutable and keyed by content hash, so a page of the strip
+# is only read from the store once
+@st.cache_data(max_entries=256)
+def load_thumbnails(digests):
+    with get_store_pool().connection() as store:
+        return get_thumbnails(store, digests)
+
+# Full-size screenshots, fetched only when one is opened and kept in an LRU
+# cache of the most recently viewed images
+@st.cache_data(max_entries=32)
+def load_screenshot_data(digest):
+    with get_store_pool().connection() as store:
+        return get_stored_screenshot(store, digest)
+
+def load_screenshot(stock_id):
+    with get_pool().connection() as conn:
+        result = conn.execute(
+            'SELECT screenshot_hash, screenshot FROM stock_data WHERE id = ?', (int(stock_id),)
+        ).fetchone()
+    if not result:
+        return None
+    # Read through the blob store, falling back to rows not yet migrated
+    if result[0]:
+        return load_screenshot_data(result[0])
+    return result[1]
@@ -0,0 +1,89 @@
+import sqlite3
+import time
+from datetime import datetime
+import pandas as pd
+from migrations import migrate
+
+DB_PATH = 'product_database.db'
+
+def get_connection(path=DB_PATH):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # WAL lets the Streamlit UI keep reading while a crawl is writing
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+# Bring the schema up to date with the versioned migrations
+def setup_database(conn):
+    migrate(conn)
+
+# Times are stored as integer Unix epoch seconds (UTC), the same clock as
+# SQLite's 'now' and 'unixepoch'. Naive datetimes on either side of these
+# helpers are local time.
+def to_epoch(value):
+    return int(value.timestamp())
+
+def from_epoch(value):
+    return datetime.fromtimestamp(value)
+
+def now_epoch():
+    return int(time.time())
+
+# Epoch seconds shifted by the local UTC offset in effect at each of them,
+# so that // 86400 gives local days. The offset is looked up once per
+# distinct value; every row of a crawl shares its timestamp.
+def local_seconds(values):
+    values = pd.Series(values)
+    unique = values.dropna().unique()
+    offsets = pd.Series([time.localtime(value).tm_gmtoff for value in unique], index=unique, dtype='float64')
+    return values + values.map(offsets)
+
+# Epoch seconds as naive local datetimes for display and grouping
+def local_times(values):
+    return pd.to_datetime(local_seconds(values), unit='s')
+
+# Return the id of a category/subcategory pair, creating the lookup rows if
+# needed. cache maps (category, subcategory) -> id across calls.
+def get_subcategory_id(conn, category, subcategory, cache=None):
+    key = (category, subcategory)
+    if cache is not None and key in cache:
+        return cache[key]
+    conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
+    category_id = conn.execute('SELECT id FROM categories WHERE name = ?', (category,)).fetchone()[0]
+    conn.execute('INSERT OR IGNORE INTO subcategories (category_id, name) VALUES (?, ?)', (category_id, subcategory))
+    subcategory_id = conn.execute(
+        'SELECT id FROM subcategories WHERE category_id = ? AND name = ?', (category_id, subcategory)
+    ).fetchone()[0]
+    if cache is not None:
+        cache[key] = subcategory_id
+    return subcategory_id
+
+def set_last_scrape(conn):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO scrape_meta (key, value) VALUES ('last_scrape', ?)",
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),)
+        )
+
+def get_last_scrape(conn):
+    if not table_exists(conn, 'scrape_meta'):
+        return None
+    row = conn.execute("SELECT value FROM scrape_meta WHERE key = 'last_scrape'").fetchone()
+    return row[0] if row else None
+
+def table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+# product_link -> (etag, last_modified, content_hash) from the last crawl
+def load_crawl_state(conn):
+    if not table_exists(conn, 'crawl_state'):
+        return {}
+    return {
+        link: (etag, last_modified, content_hash)
+        for link, etag, last_modified, content_hash in conn.execute('''
+            SELECT pi.product_link, cs.etag, cs.last_modified, cs.content_hash
+            FROM crawl_state cs
+            JOIN product_info pi ON pi.id = cs.product_id
+        ''')
+    }
@@ -0,0 +1,157 @@
+import sys
+import numpy as np
+import pandas as pd
+from database import DB_PATH, get_connection, setup_database
+
+# Thresholds for event detection. A restock is a rise of at least
+# restock_min_units. A drop is a fall of at least drop_min_units that is
+# either drop_min_pct of the previous stock or sold much faster than the
+# product usually sells: above its median rate plus drop_mad_factor median
+# absolute deviations, and at least drop_rate_multiple times the median.
+# Rates are judged over the last stats_days of history and velocity is the
+# units sold per day over the last velocity_days.
+EVENT_RULES = {
+    'restock_min_units': 50,
+    'drop_min_units': 20,
+    'drop_min_pct': 25.0,
+    'drop_mad_factor': 5.0,
+    'drop_rate_multiple': 3.0,
+    'price_min_change': 0.01,
+    'stats_days': 30,
+    'velocity_days': 7,
+}
+EVENT_COLUMNS = ['product_id', 'stock_id', 'date', 'event_type', 'previous_value', 'value', 'change', 'change_pct']
+
+def get_last_event_id(conn):
+    row = conn.execute("SELECT value FROM scrape_meta WHERE key = 'events_last_id'").fetchone()
+    return int(row[0]) if row else 0
+
+def set_last_event_id(conn, last_id):
+    conn.execute('''
+        INSERT INTO scrape_meta (key, value) VALUES ('events_last_id', ?)
+        ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))
+    ''', (str(last_id),))
+
+def _event_frame(df, mask, event_type, previous, value):
+    change = value - previous
+    return pd.DataFrame({
+        'product_id': df['product_id'][mask],
+        'stock_id': df['stock_id'][mask],
+        'date': df['date'][mask],
+        'event_type': event_type,
+        'previous_value': previous[mask],
+        'value': value[mask],
+        'change': change[mask],
+        'change_pct': (change / previous.where(previous != 0) * 100)[mask],
+    })
+
+# Find events in the stock series of many products at once. df has one row
+# per scrape (product_id, stock_id, date, stock_amount, price); each row is
+# compared with the previous row of the same product.
+def detect_events(df, rules=EVENT_RULES):
+    df = df.sort_values(['product_id', 'date', 'stock_id'], ignore_index=True)
+    by_product = df.groupby('product_id', sort=False)
+    stock = df['stock_amount'].astype(float)
+    price = df['price'].astype(float)
+    previous_stock = by_product['stock_amount'].shift().astype(float)
+    previous_price = by_product['price'].shift().astype(float)
+    stock_change = stock - previous_stock
+    hours = (df['date'] - by_product['date'].shift()) / 3600
+
+    # Units sold per hour since the previous scrape, and each product's usual rate
+    sold_rate = (-stock_change).where((stock_change < 0) & (hours > 0)) / hours
+    median_rate = sold_rate.groupby(df['product_id']).transform('median')
+    mad_rate = (sold_rate - median_rate).abs().groupby(df['product_id']).transform('median')
+    unusual_rate = sold_rate > np.maximum(
+        median_rate + rules['drop_mad_factor'] * mad_rate, rules['drop_rate_multiple'] * median_rate
+    )
+
+    restock = stock_change >= rules['restock_min_units']
+    drop = (-stock_change >= rules['drop_min_units']) & (
+        (-stock_change / previous_stock.where(previous_stock > 0) * 100 >= rules['drop_min_pct']) | unusual_rate
+    )
+    price_change = (price - previous_price).abs() >= rules['price_min_change']
+
+    events = pd.concat([
+        _event_frame(df, restock, 'restock', previous_stock, stock),
+        _event_frame(df, drop, 'drop', previous_stock, stock),
+        _event_frame(df, price_change, 'price_change', previous_price, price),
+    ], ignore_index=True)
+    return events.sort_values(['date', 'product_id'], ignore_index=True)
+
+# Units sold per day over each product's last velocity_days (restocks are
+# not counted as negative sales) and how many days the current stock lasts
+def sales_velocity(df, rules=EVENT_RULES):
+    df = df.sort_values(['product_id', 'date', 'stock_id'], ignore_index=True)
+    by_product = df.groupby('product_id', sort=False)
+    sold = (by_product['stock_amount'].shift() - df['stock_amount']).clip(lower=0)
+    previous_date = by_product['date'].shift()
+    latest = by_product['date'].transform('max')
+    recent = df['date'] >= latest - rules['velocity_days'] * 86400
+
+    window = pd.DataFrame({
+        'product_id': df['product_id'],
+        'sold': sold,
+        'start': previous_date.fillna(df['date']),
+        'end': df['date'],
+        'stock': df['stock_amount'],
+    })[recent].groupby('product_id').agg(sold=('sold', 'sum'), start=('start', 'min'), end=('end', 'max'), stock=('stock', 'last'))
+    days = (window['end'] - window['start']) / 86400
+    velocity = pd.DataFrame({
+        'product_id': window.index,
+        'units_per_day': (window['sold'] / days.where(days > 0)).values,
+        'current_stock': window['stock'].values,
+        'window_start': window['start'].astype(int).values,
+        'window_end': window['end'].astype(int).values,
+    })
+    velocity['days_of_cover'] = velocity['current_stock'] / velocity['units_per_day'].where(velocity['units_per_day'] > 0)
+    return velocity
+
+# Detect events in the rows added since the last update and refresh the
+# velocity of the products they belong to. The series are loaded from
+# stats_days before the oldest new row, so each new row has its previous
+# scrape and enough history for the usual sales rate. Events are unique per
+# stock row, so overlapping updates from parallel crawls are harmless.
+def update_events(conn, rules=EVENT_RULES, rebuild=False):
+    if rebuild:
+        with conn:
+            conn.execute('DELETE FROM stock_events')
+            conn.execute('DELETE FROM product_velocity')
+            conn.execute("DELETE FROM scrape_meta WHERE key = 'events_last_id'")
+    last_id = get_last_event_id(conn)
+    new = conn.execute('SELECT MIN(date), MAX(id) FROM stock_data WHERE id > ?', (last_id,)).fetchone()
+    if new[1] is None:
+        return 0
+    since = new[0] - rules['stats_days'] * 86400
+    df = pd.read_sql_query('''
+        SELECT sd.product_id, sd.id AS stock_id, sd.date, sd.stock_amount, sd.price
+        FROM stock_data sd
+        WHERE sd.date >= ? AND sd.product_id IN (SELECT DISTINCT product_id FROM stock_data WHERE id > ?)
+    ''', conn, params=(since, last_id)).dropna(subset=['stock_amount'])
+
+    events = detect_events(df, rules)
+    events = events[events['stock_id'] > last_id]
+    velocity = sales_velocity(df, rules)
+    with conn:
+        conn.executemany(f'''
+            INSERT OR IGNORE INTO stock_events ({', '.join(EVENT_COLUMNS)})
+            VALUES ({', '.join('?' * len(EVENT_COLUMNS))})
+        ''', events[EVENT_COLUMNS].astype(object).where(events[EVENT_COLUMNS].notna(), None).itertuples(index=False))
+        conn.executemany('''
+            INSERT OR REPLACE INTO product_velocity
+                (product_id, units_per_day, days_of_cover, current_stock, window_start, window_end)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', velocity[['product_id', 'units_per_day', 'days_of_cover', 'current_stock', 'window_start', 'window_end']]
+            .astype(object).where(velocity.notna(), None).itertuples(index=False))
+        set_last_event_id(conn, new[1])
+    return len(events)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ('update', 'rebuild'):
+        conn = get_connection(DB_PATH)
+        setup_database(conn)
+        count = update_events(conn, rebuild=sys.argv[1] == 'rebuild')
+        conn.close()
+        print(f"Recorded {count} new events.")
+    else:
+        print("Usage: python events.py update|rebuild")
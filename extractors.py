@@ -0,0 +1,84 @@
+import re
+from urllib.parse import urlparse
+
+# Extraction rules per site. Each field names a CSS selector, the regex that
+# pulls the value out of the element's text and how to convert the match.
+# Hosts without their own entry use the 'default' (WooCommerce) rules.
+SITE_RULES = {
+    'default': {
+        'stock': {
+            'css': 'div.text.collapse p',
+            'regex': r'\b\d+\b',
+            'type': 'int',
+        },
+        'price': {
+            'css': 'div.price-block span.woocommerce-Price-amount.amount',
+            'regex': r'[\d,]+(?:\.\d{2})?',
+            'type': 'price',
+        },
+    },
+}
+SITE_RULES['verpakgigant.nl'] = SITE_RULES['default']
+
+# Selectors for category listing pages used by catalogue discovery
+LISTING_RULES = {
+    'default': {
+        'product': 'ul.products li.product',
+        'name': 'h2.woocommerce-loop-product__title',
+        'link': 'a.woocommerce-LoopProduct-link::attr(href)',
+        'next': 'a.next.page-numbers::attr(href)',
+    },
+}
+LISTING_RULES['verpakgigant.nl'] = LISTING_RULES['default']
+
+CONVERTERS = {
+    'int': int,
+    'float': float,
+    'price': lambda value: float(value.replace(',', '')),
+}
+
+_compiled = {}
+
+def normalize_host(host):
+    host = (host or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+def get_rules(host):
+    return SITE_RULES.get(normalize_host(host), SITE_RULES['default'])
+
+def _compile(rules):
+    key = id(rules)
+    if key not in _compiled:
+        _compiled[key] = [
+            (field, rule['css'], re.compile(rule['regex']), CONVERTERS[rule['type']])
+            for field, rule in rules.items()
+        ]
+    return _compiled[key]
+
+# Extract every field from an already-parsed selector (a Scrapy response or a
+# parsel Selector). The document is parsed once by lxml and each field reads
+# the text of the first element matching its selector.
+def extract_fields(selector, host=None):
+    if host is None and hasattr(selector, 'url'):
+        host = urlparse(selector.url).hostname
+    values = {}
+    for field, css, regex, convert in _compile(get_rules(host)):
+        text = selector.css(css)[:1].xpath('normalize-space(string())').get()
+        match = regex.search(text) if text else None
+        values[field] = convert(match.group(0)) if match else None
+    return values
+
+# Extract [name, link] pairs and the next page URL from a listing page
+def extract_listing(response):
+    rules = LISTING_RULES.get(normalize_host(urlparse(response.url).hostname), LISTING_RULES['default'])
+    products = []
+    for node in response.css(rules['product']):
+        link = node.css(rules['link']).get()
+        if not link:
+            continue
+        name = node.css(rules['name'])[:1].xpath('normalize-space(string())').get()
+        products.append([name, response.urljoin(link)])
+    next_url = response.css(rules['next']).get()
+    return products, response.urljoin(next_url) if next_url else None
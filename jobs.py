@@ -0,0 +1,154 @@
+import os
+import subprocess
+import sys
+import pandas as pd
+from database import DB_PATH, get_connection, setup_database, now_epoch
+
+LOG_DIR = 'logs'
+SPIDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stock_spider.py')
+ACTIVE_STATUSES = ('queued', 'running', 'cancelling')
+# A job started by another UI process that has not reported for this long is
+# treated as dead
+STALE_SECONDS = 120
+
+# Crawl processes started by this process, job id -> Popen, so finished ones
+# are reaped and crashes are noticed
+_processes = {}
+
+def now():
+    return now_epoch()
+
+def open_jobs_db(path=DB_PATH):
+    conn = get_connection(path)
+    setup_database(conn)
+    return conn
+
+# Short description of what a job crawls, shown in the job list
+def job_scope(discover=False, categories=None, shard=None, shards=1, scrape=True):
+    if not scrape:
+        return 'discover'
+    scope = ', '.join(categories) if categories else 'all categories'
+    if discover:
+        scope = f'discover + {scope}'
+    if shard is not None:
+        scope = f'{scope} (shard {shard + 1}/{shards})'
+    return scope
+
+# Start a crawl in its own process and return the job id. The process runs
+# stock_spider.py and writes its output to logs/crawl_job_<id>.log.
+# categories, shard/shards and scrape=False (discovery only) limit the crawl.
+def start_job(profile='default', incremental=False, discover=False, categories=None, shard=None, shards=1, scrape=True):
+    conn = open_jobs_db()
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO crawl_jobs (status, profile, incremental, discover, scope, created_at, updated_at)
+            VALUES ('queued', ?, ?, ?, ?, ?, ?)
+        ''', (profile, int(incremental), int(discover), job_scope(discover, categories, shard, shards, scrape), now(), now()))
+    job_id = cursor.lastrowid
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f'crawl_job_{job_id}.log')
+    command = [sys.executable, SPIDER_SCRIPT, '--job', str(job_id), '--profile', profile]
+    if incremental:
+        command.append('--incremental')
+    if discover:
+        command.append('--discover' if scrape else '--discover-only')
+    for category in categories or []:
+        command += ['--category', category]
+    if shard is not None:
+        command += ['--shard', str(shard), '--shards', str(shards)]
+    with open(log_path, 'ab') as log_file:
+        process = subprocess.Popen(
+            command, stdout=log_file, stderr=subprocess.STDOUT, env={**os.environ, 'PYTHONUNBUFFERED': '1'}
+        )
+    _processes[job_id] = process
+
+    with conn:
+        conn.execute('UPDATE crawl_jobs SET pid = ?, log_path = ? WHERE id = ?', (process.pid, log_path, job_id))
+    conn.close()
+    return job_id
+
+# Ask a job to stop. The crawl process notices on its next progress report
+# and closes the spider, keeping everything scraped so far.
+def cancel_job(job_id):
+    conn = open_jobs_db()
+    with conn:
+        conn.execute(
+            "UPDATE crawl_jobs SET status = 'cancelling' WHERE id = ? AND status IN ('queued', 'running')", (job_id,)
+        )
+    conn.close()
+
+# Called by the crawl process itself
+def mark_running(conn, job_id):
+    with conn:
+        conn.execute(
+            "UPDATE crawl_jobs SET status = 'running', pid = ?, started_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+            (os.getpid(), now(), now(), job_id)
+        )
+
+# Store a progress snapshot and return the job status, so the caller can
+# react to a cancel request
+def report_progress(conn, job_id, phase, done, total, errors, eta_seconds):
+    with conn:
+        conn.execute('''
+            UPDATE crawl_jobs SET phase = ?, done = ?, total = ?, errors = ?, eta_seconds = ?, updated_at = ?
+            WHERE id = ?
+        ''', (phase, done, total, errors, eta_seconds, now(), job_id))
+    return get_status(conn, job_id)
+
+def get_status(conn, job_id):
+    row = conn.execute('SELECT status FROM crawl_jobs WHERE id = ?', (job_id,)).fetchone()
+    return row[0] if row else None
+
+def get_errors(conn, job_id):
+    row = conn.execute('SELECT errors FROM crawl_jobs WHERE id = ?', (job_id,)).fetchone()
+    return (row[0] or 0) if row else 0
+
+def finish_job(conn, job_id, status, message=None):
+    with conn:
+        conn.execute('''
+            UPDATE crawl_jobs SET status = ?, message = COALESCE(?, message), eta_seconds = NULL,
+                finished_at = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, message, now(), now(), job_id))
+
+# Mark jobs whose process has exited without finishing, or that stopped
+# reporting, as failed
+def reap_jobs(conn):
+    running_here = []
+    for job_id, process in list(_processes.items()):
+        code = process.poll()
+        if code is None:
+            running_here.append(job_id)
+            continue
+        del _processes[job_id]
+        with conn:
+            conn.execute(f'''
+                UPDATE crawl_jobs SET status = 'failed', message = ?, finished_at = ?, updated_at = ?
+                WHERE id = ? AND status IN {ACTIVE_STATUSES}
+            ''', (f"Crawl process exited with code {code}", now(), now(), job_id))
+
+    placeholders = ','.join('?' * len(running_here))
+    with conn:
+        conn.execute(f'''
+            UPDATE crawl_jobs SET status = 'failed', message = 'Crawl process stopped reporting', finished_at = ?
+            WHERE status IN {ACTIVE_STATUSES} AND updated_at < ? AND id NOT IN ({placeholders})
+        ''', (now(), now() - STALE_SECONDS, *running_here))
+
+# The most recent jobs, newest first
+def list_jobs(limit=20):
+    conn = open_jobs_db()
+    reap_jobs(conn)
+    df = pd.read_sql_query('SELECT * FROM crawl_jobs ORDER BY id DESC LIMIT ?', conn, params=(limit,))
+    conn.close()
+    return df
+
+# The last lines of a job's log, read from the end of the file
+def log_tail(path, lines=100, block_size=65536):
+    if not path or not os.path.exists(path):
+        return ''
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - block_size))
+        data = f.read().decode('utf-8', errors='replace')
+    return '\n'.join(data.splitlines()[-lines:])
@@ -1,83 +1,146 @@
 import streamlit as st
 import subprocess
 import time
-import threading
-from queue import Queue
-from stock_spider import run_spider
+from crawl_profiles import CRAWL_PROFILES
+from data_access import data_version, load_rollup_date_range, load_overview_page, load_overview_groups
+from database import from_epoch
+from jobs import ACTIVE_STATUSES, start_job, cancel_job, list_jobs, log_tail
 import pandas as pd
-import sqlite3
 from datetime import datetime, timedelta
 import plotly.express as px
 from st_aggrid import AgGrid, GridOptionsBuilder
 
 st.set_page_config(page_title="Product Stock Management", layout="wide")
 
-def run_scraper():
-    message_queue = Queue()
-    
-    def scraper_thread():
-        run_spider(message_queue)
-    
-    thread = threading.Thread(target=scraper_thread)
-    thread.start()
-    
-    placeholder = st.empty()
-    log_messages = []
-    with st.spinner("Scraping in progress..."):
-        while thread.is_alive() or not message_queue.empty():
-            try:
-                message = message_queue.get(timeout=0.1)
-                log_messages.append(message)
-                placeholder.text("\n".join(log_messages))
-            except:
-                pass
-    
-        st.success("Scraping completed successfully!")
-
-def get_connection():
-    return sqlite3.connect('product_database.db', check_same_thread=False)
-
-def load_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Check if the required tables exist
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND (name='product_info' OR name='stock_data')")
-    existing_tables = [row[0] for row in cursor.fetchall()]
-    
-    if 'product_info' not in existing_tables or 'stock_data' not in existing_tables:
-        # If tables don't exist, return an empty DataFrame
-        return pd.DataFrame()
-    
-    # If tables exist, proceed with the query
-    query = """
-    SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount
-    FROM product_info pi
-    JOIN stock_data sd ON pi.id = sd.product_id
-    """
-    df = pd.read_sql_query(query, conn)
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date'])
-    return df
+def format_duration(seconds):
+    if seconds is None or pd.isna(seconds):
+        return "-"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+def job_progress_text(job):
+    if job['total'] and not pd.isna(job['total']):
+        progress = f"{job['done']}/{int(job['total'])} products"
+    else:
+        progress = f"{job['done']} pages"
+    return f"{job['phase'] or 'starting'}: {progress}, {job['errors']} errors, ETA {format_duration(job['eta_seconds'])}"
+
+# Re-rendered on its own every couple of seconds; each run is one small
+# query, so the rest of the page never blocks on a crawl
+@st.fragment(run_every=2)
+def show_jobs():
+    jobs = list_jobs()
+    if jobs.empty:
+        st.info("No scraper runs yet.")
+        return
+
+    active = jobs[jobs['status'].isin(ACTIVE_STATUSES)]
+    for _, job in active.iterrows():
+        with st.container(border=True):
+            st.write(f"**Job {job['id']}** ({job['profile']}, {job['scope']}) - {job['status']}")
+            fraction = job['done'] / job['total'] if job['total'] and not pd.isna(job['total']) else 0.0
+            st.progress(min(float(fraction), 1.0), text=job_progress_text(job))
+            if job['status'] != 'cancelling' and st.button("Cancel", key=f"cancel_{job['id']}"):
+                cancel_job(int(job['id']))
+
+    st.subheader("Recent Runs")
+    table = jobs[['id', 'status', 'profile', 'scope', 'phase', 'done', 'total', 'errors', 'message']].copy()
+    table['total'] = table['total'].astype('Int64')
+    table['started'] = jobs['created_at'].map(lambda value: from_epoch(value).strftime('%Y-%m-%d %H:%M:%S'))
+    table['duration'] = [
+        format_duration((finished if not pd.isna(finished) else updated) - created)
+        for created, updated, finished in zip(jobs['created_at'], jobs['updated_at'], jobs['finished_at'])
+    ]
+    st.dataframe(table, hide_index=True)
+
+    job_id = st.selectbox("Show log for job", jobs['id'], key="log_job")
+    log_path = jobs.loc[jobs['id'] == job_id, 'log_path'].iloc[0]
+    st.code(log_tail(log_path) or "No output yet.", language=None)
+
+OVERVIEW_SORT_COLUMNS = [
+    'stock_change_percentage', 'stock_change', 'initial_stock', 'final_stock', 'price_change_percentage',
+    'price_change', 'initial_price', 'current_price', 'product_name', 'category', 'subcategory'
+]
+OVERVIEW_PAGE_SIZES = [25, 50, 100, 200]
+
+# Product Overview grid. Filtering, sorting, paging and the category and
+# subcategory totals all run as SQL over the daily rollup, so only the page
+# on screen is loaded and sent to the grid.
+def show_overview(version, start_date, end_date):
+    st.subheader(f"Product Stock and Price Overview ({start_date} to {end_date})")
+    all_groups = load_overview_groups(version, start_date, end_date, level='subcategory')
+    if all_groups.empty:
+        st.warning("No data available for the selected date range.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    category = col1.selectbox("Category", ['All'] + sorted(all_groups['category'].unique()))
+    category = None if category == 'All' else category
+    subcategories = all_groups.loc[all_groups['category'] == category, 'subcategory'] if category else []
+    subcategory = col2.selectbox("Subcategory", ['All'] + sorted(subcategories))
+    subcategory = None if subcategory == 'All' else subcategory
+    search = col3.text_input("Product name contains").strip()
+    min_change_pct = col4.number_input("Min. stock change (±%)", min_value=0.0, value=0.0, step=5.0)
+    filters = tuple(
+        (name, value) for name, value in (
+            ('category', category), ('subcategory', subcategory), ('search', search), ('min_change_pct', min_change_pct)
+        ) if value
+    )
+
+    # Totals per category, or per subcategory once a category is picked
+    groups = load_overview_groups(version, start_date, end_date, filters, 'subcategory' if category else 'category')
+    total = int(groups['products'].sum())
+    with st.expander(f"Totals by {'subcategory' if category else 'category'}", expanded=False):
+        st.dataframe(groups, hide_index=True)
+    if not total:
+        st.warning("No products match the filters.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    sort = col1.selectbox("Sort by", [None] + OVERVIEW_SORT_COLUMNS,
+                          format_func=lambda column: 'largest stock change (±%)' if column is None else column)
+    descending = col2.selectbox("Order", ["Descending", "Ascending"], disabled=sort is None) == "Descending"
+    page_size = col3.selectbox("Rows per page", OVERVIEW_PAGE_SIZES, index=1)
+    pages = (total - 1) // page_size + 1
+    page = col4.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+
+    display_df = load_overview_page(version, start_date, end_date, filters, sort, descending, page, page_size)
+    st.caption(f"Products {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(display_df)} of {total}")
+
+    gb = GridOptionsBuilder.from_dataframe(display_df)
+    # Rows arrive sorted and filtered; sorting in the grid would only reorder this page
+    gb.configure_default_column(sortable=False, filter=False)
+    gb.configure_side_bar()
+    gb.configure_selection('single', use_checkbox=True, groupSelectsChildren="Group checkbox select children")
+    gb.configure_columns(['initial_stock', 'final_stock', 'stock_change'], type=["numericColumn", "customNumericFormat"], precision=0)
+    for col in ['stock_change_percentage', 'price_change_percentage']:
+        gb.configure_column(col, type=["numericColumn", "customNumericFormat"], precision=2,
+                            valueFormatter=f"data.{col} == null ? '' : data.{col}.toFixed(2) + '%'")
+    for col in ['initial_price', 'current_price', 'price_change']:
+        gb.configure_column(col, type=["numericColumn", "customNumericFormat"], precision=2, valueFormatter=f"'$' + data.{col}.toFixed(2)")
+    gridOptions = gb.build()
+
+    AgGrid(display_df, gridOptions=gridOptions, enable_enterprise_modules=True,
+            update_mode='MODEL_CHANGED', height=min(800, 60 + 30 * len(display_df)), fit_columns_on_grid_load=False)
 
 def main():
-    menu = ["Product Overview", "Run Scraper", "Stock Tracker"]
+    menu = ["Product Overview", "Run Scraper", "Stock Tracker", "Stock Events", "Crawl Performance"]
     choice = st.sidebar.selectbox("Menu", menu)
 
     if choice == "Product Overview":
         st.title("Product Stock Management System")
         st.write("Welcome to the Product Stock Management System!")
         
-        # Load data
-        df = load_data()
+        # Load the date range covered by the daily rollup
+        version = data_version()
+        min_date, max_date = load_rollup_date_range(version)
         
-        if df.empty:
+        if min_date is None:
             st.warning("No data available. The database might be empty or not initialized. Please run the scraper to collect data.")
         else:
             # Date range selector
             st.sidebar.header("Date Range")
-            min_date = df['date'].min().date()
-            max_date = df['date'].max().date()
             
             # Set default date range to last 30 days, but not exceeding available data range
             default_end_date = max_date
@@ -90,66 +153,32 @@ def main():
             if start_date > end_date:
                 st.sidebar.error('Error: End date must fall after start date.')
             else:
-                # Filter data based on date range
-                mask = (df['date'].dt.date >= start_date) & (df['date'].dt.date <= end_date)
-                filtered_df = df.loc[mask]
-                
-                if filtered_df.empty:
-                    st.warning("No data available for the selected date range.")
-                else:
-                    # Calculate stock changes and price changes
-                    stock_changes = filtered_df.groupby('product_name').agg({
-                        'stock_amount': ['first', 'last'],
-                        'price': ['first', 'last']
-                    })
-                    stock_changes.columns = ['initial_stock', 'final_stock', 'initial_price', 'current_price']
-                    stock_changes['stock_change'] = stock_changes['final_stock'] - stock_changes['initial_stock']
-                    stock_changes['stock_change_percentage'] = (stock_changes['stock_change'] / stock_changes['initial_stock']) * 100
-                    stock_changes['price_change'] = stock_changes['current_price'] - stock_changes['initial_price']
-                    stock_changes['price_change_percentage'] = (stock_changes['price_change'] / stock_changes['initial_price']) * 100
-                    
-                    # Remove rows with null stock amounts
-                    stock_changes = stock_changes.dropna(subset=['initial_stock', 'final_stock', 'initial_price', 'current_price'])
-                    
-                    # Sort by absolute stock change percentage
-                    stock_changes = stock_changes.sort_values('stock_change_percentage', key=abs, ascending=False)
-                    
-                    # Display overview
-                    st.subheader(f"Product Stock and Price Overview ({start_date} to {end_date})")
-                    
-                    # Prepare data for display
-                    display_df = stock_changes.reset_index()
-                    display_df['stock_change_percentage'] = display_df['stock_change_percentage'].round(2)
-                    display_df['price_change_percentage'] = display_df['price_change_percentage'].round(2)
-                    
-                    # Format numeric columns
-                    for col in ['initial_stock', 'final_stock', 'stock_change']:
-                        display_df[col] = display_df[col].astype(int)
-                    for col in ['initial_price', 'current_price', 'price_change']:
-                        display_df[col] = display_df[col].round(2)
-
-                    gb = GridOptionsBuilder.from_dataframe(display_df)
-                    gb.configure_pagination(paginationAutoPageSize=True)
-                    gb.configure_side_bar()
-                    gb.configure_selection('single', use_checkbox=True, groupSelectsChildren="Group checkbox select children")
-                    gb.configure_columns(['initial_stock', 'final_stock', 'stock_change'], type=["numericColumn", "numberColumnFilter", "customNumericFormat"], precision=0)
-                    gb.configure_column("stock_change_percentage", type=["numericColumn", "numberColumnFilter", "customNumericFormat"], precision=2, valueFormatter="data.stock_change_percentage.toFixed(2) + '%'")
-                    gb.configure_column("price_change_percentage", type=["numericColumn", "numberColumnFilter", "customNumericFormat"], precision=2, valueFormatter="data.price_change_percentage.toFixed(2) + '%'")
-                    for col in ['initial_price', 'current_price', 'price_change']:
-                        gb.configure_column(col, type=["numericColumn", "numberColumnFilter", "customNumericFormat"], precision=2, valueFormatter=f"'$' + data.{col}.toFixed(2)")
-                    gridOptions = gb.build()
-
-                    AgGrid(display_df, gridOptions=gridOptions, enable_enterprise_modules=True, 
-                            update_mode='MODEL_CHANGED', height=800, fit_columns_on_grid_load=False)
+                show_overview(version, start_date, end_date)
 
     elif choice == "Run Scraper":
         st.subheader("Web Scraper")
+        profiles = list(CRAWL_PROFILES)
+        profile = st.selectbox("Crawl Profile", profiles, index=profiles.index('default'))
+        incremental = st.checkbox("Incremental crawl (skip unchanged products)")
+        discover = st.checkbox("Discover new and removed products first")
         if st.button("Start Scraping"):
-            run_scraper()
+            # The crawl runs in its own process, so several runs can be
+            # started and the page stays responsive
+            job_id = start_job(profile, incremental, discover)
+            st.success(f"Started scraper job {job_id}.")
+        show_jobs()
 
     elif choice == "Stock Tracker":
         import stock_tracker
         stock_tracker.main()
 
+    elif choice == "Stock Events":
+        import stock_events
+        stock_events.main()
+
+    elif choice == "Crawl Performance":
+        import crawl_performance
+        crawl_performance.main()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,393 @@
+import sqlite3
+import sys
+
+DB_PATH = 'product_database.db'
+
+# Versioned schema migrations. The applied version is kept in
+# PRAGMA user_version and every migration runs in its own transaction, so an
+# existing product_database.db is upgraded in place one step at a time.
+
+def ensure_column(conn, table, column, definition):
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# The schema as it stood before versioning. Every statement is idempotent so
+# databases created by any earlier version of the spider end up the same.
+def baseline_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT,
+            subcategory TEXT,
+            product_name TEXT,
+            product_link TEXT UNIQUE
+        )
+    ''')
+    ensure_column(conn, 'product_info', 'active', 'INTEGER DEFAULT 1')
+    ensure_column(conn, 'product_info', 'last_seen', 'TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            date TEXT,
+            stock_amount INTEGER,
+            price REAL,
+            screenshot BLOB,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+    ensure_column(conn, 'stock_data', 'screenshot_hash', 'TEXT')
+    # Validators and content hash from the last crawl of each product, used by
+    # incremental crawls. checked_at is the last time the product was seen,
+    # even when nothing changed and no stock_data row was written.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            product_id INTEGER PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            checked_at TEXT,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+    # One row per listing page crawled by catalogue discovery. products is a
+    # JSON list of [name, link] so unchanged pages can be reused without a fetch.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS listing_state (
+            url TEXT PRIMARY KEY,
+            category TEXT,
+            subcategory TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            products TEXT,
+            next_url TEXT,
+            checked_at TEXT
+        )
+    ''')
+    # Key/value metadata; 'last_scrape' is the version stamp the UI caches on
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            product_id INTEGER,
+            day TEXT,
+            first_stock INTEGER,
+            last_stock INTEGER,
+            min_stock INTEGER,
+            max_stock INTEGER,
+            first_price REAL,
+            last_price REAL,
+            min_price REAL,
+            max_price REAL,
+            samples INTEGER,
+            first_date TEXT,
+            last_date TEXT,
+            PRIMARY KEY (product_id, day)
+        )
+    ''')
+
+# Store scrape times as integer Unix epoch seconds instead of TEXT. Existing
+# values are naive local wall-clock times, converted to UTC with the local
+# offset in effect at each of them.
+def epoch_timestamps(conn):
+    conn.execute('''
+        CREATE TABLE stock_data_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            date INTEGER,
+            stock_amount INTEGER,
+            price REAL,
+            screenshot BLOB,
+            screenshot_hash TEXT,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO stock_data_new (id, product_id, date, stock_amount, price, screenshot, screenshot_hash)
+        SELECT id, product_id, CAST(strftime('%s', date, 'utc') AS INTEGER), stock_amount, price, screenshot, screenshot_hash
+        FROM stock_data
+    ''')
+    conn.execute('DROP TABLE stock_data')
+    conn.execute('ALTER TABLE stock_data_new RENAME TO stock_data')
+
+    conn.execute('''
+        CREATE TABLE crawl_state_new (
+            product_id INTEGER PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            checked_at INTEGER,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO crawl_state_new (product_id, etag, last_modified, content_hash, checked_at)
+        SELECT product_id, etag, last_modified, content_hash, CAST(strftime('%s', checked_at, 'utc') AS INTEGER)
+        FROM crawl_state
+    ''')
+    conn.execute('DROP TABLE crawl_state')
+    conn.execute('ALTER TABLE crawl_state_new RENAME TO crawl_state')
+
+    # The rollup is derived data; it is rebuilt from stock_data when found empty
+    conn.execute('DROP TABLE daily_rollup')
+    conn.execute('''
+        CREATE TABLE daily_rollup (
+            product_id INTEGER,
+            day TEXT,
+            first_stock INTEGER,
+            last_stock INTEGER,
+            min_stock INTEGER,
+            max_stock INTEGER,
+            first_price REAL,
+            last_price REAL,
+            min_price REAL,
+            max_price REAL,
+            samples INTEGER,
+            first_date INTEGER,
+            last_date INTEGER,
+            PRIMARY KEY (product_id, day)
+        )
+    ''')
+
+# Move category and subcategory names into lookup tables. Readers use the
+# products view, which has the same columns product_info used to have.
+def category_lookup_tables(conn):
+    conn.execute('''
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE subcategories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER,
+            name TEXT,
+            UNIQUE (category_id, name),
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    ''')
+    conn.execute('INSERT INTO categories (name) SELECT DISTINCT category FROM product_info')
+    conn.execute('''
+        INSERT INTO subcategories (category_id, name)
+        SELECT DISTINCT c.id, pi.subcategory
+        FROM product_info pi
+        JOIN categories c ON c.name IS pi.category
+    ''')
+    conn.execute('''
+        CREATE TABLE product_info_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subcategory_id INTEGER,
+            product_name TEXT,
+            product_link TEXT UNIQUE,
+            active INTEGER DEFAULT 1,
+            last_seen TEXT,
+            FOREIGN KEY (subcategory_id) REFERENCES subcategories (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO product_info_new (id, subcategory_id, product_name, product_link, active, last_seen)
+        SELECT pi.id, s.id, pi.product_name, pi.product_link, pi.active, pi.last_seen
+        FROM product_info pi
+        JOIN categories c ON c.name IS pi.category
+        JOIN subcategories s ON s.category_id = c.id AND s.name IS pi.subcategory
+    ''')
+    conn.execute('DROP TABLE product_info')
+    conn.execute('ALTER TABLE product_info_new RENAME TO product_info')
+    conn.execute('''
+        CREATE VIEW products AS
+        SELECT p.id, c.name AS category, s.name AS subcategory, p.product_name, p.product_link,
+            p.active, p.last_seen, p.subcategory_id
+        FROM product_info p
+        JOIN subcategories s ON s.id = p.subcategory_id
+        JOIN categories c ON c.id = s.category_id
+    ''')
+
+def indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_data_product_date ON stock_data (product_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_data_date ON stock_data (date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_product_info_subcategory ON product_info (subcategory_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_rollup_day ON daily_rollup (day)')
+    conn.execute('ANALYZE')
+
+# Background crawl jobs started from the UI. The crawl process reports its
+# progress into its row and polls status for cancellation.
+def crawl_jobs(conn):
+    conn.execute('''
+        CREATE TABLE crawl_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT,
+            profile TEXT,
+            incremental INTEGER,
+            discover INTEGER,
+            pid INTEGER,
+            phase TEXT,
+            done INTEGER DEFAULT 0,
+            total INTEGER,
+            errors INTEGER DEFAULT 0,
+            eta_seconds REAL,
+            message TEXT,
+            log_path TEXT,
+            created_at INTEGER,
+            started_at INTEGER,
+            updated_at INTEGER,
+            finished_at INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_crawl_jobs_status ON crawl_jobs (status)')
+
+# What each job covers, and leases that keep scheduled crawls from running
+# twice. last_slot is the scheduled time of the last run started under the
+# lease, so a slot is only ever run once even by several schedulers.
+def crawl_leases(conn):
+    ensure_column(conn, 'crawl_jobs', 'scope', 'TEXT')
+    conn.execute('''
+        CREATE TABLE crawl_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at INTEGER,
+            last_slot INTEGER
+        )
+    ''')
+
+# Restocks, sharp drops and price changes found by events.py, one row per
+# stock_data row and event type, and each product's recent sales velocity
+def stock_events(conn):
+    conn.execute('''
+        CREATE TABLE stock_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            stock_id INTEGER,
+            date INTEGER,
+            event_type TEXT,
+            previous_value REAL,
+            value REAL,
+            change REAL,
+            change_pct REAL,
+            UNIQUE (stock_id, event_type),
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_stock_events_date ON stock_events (date)')
+    conn.execute('''
+        CREATE TABLE product_velocity (
+            product_id INTEGER PRIMARY KEY,
+            units_per_day REAL,
+            days_of_cover REAL,
+            current_stock INTEGER,
+            window_start INTEGER,
+            window_end INTEGER,
+            FOREIGN KEY (product_id) REFERENCES product_info (id)
+        )
+    ''')
+
+# One row per spider run, per-request timings of each stage (download,
+# parse, screenshot, db_write) and per-run aggregates of every stage, which
+# are kept after old runs' timings are pruned
+def crawl_timings(conn):
+    conn.execute('''
+        CREATE TABLE crawl_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER,
+            spider TEXT,
+            profile TEXT,
+            reason TEXT,
+            pages INTEGER,
+            items INTEGER,
+            errors INTEGER,
+            retries INTEGER,
+            elapsed REAL,
+            pages_per_sec REAL,
+            started_at INTEGER,
+            finished_at INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE crawl_timings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER,
+            stage TEXT,
+            url TEXT,
+            seconds REAL,
+            status TEXT,
+            error TEXT,
+            items INTEGER,
+            recorded_at INTEGER,
+            FOREIGN KEY (run_id) REFERENCES crawl_runs (id)
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_crawl_timings_run ON crawl_timings (run_id, stage)')
+    conn.execute('''
+        CREATE TABLE crawl_run_stages (
+            run_id INTEGER,
+            stage TEXT,
+            count INTEGER,
+            errors INTEGER,
+            total_seconds REAL,
+            mean_seconds REAL,
+            p50_seconds REAL,
+            p95_seconds REAL,
+            max_seconds REAL,
+            PRIMARY KEY (run_id, stage),
+            FOREIGN KEY (run_id) REFERENCES crawl_runs (id)
+        )
+    ''')
+
+MIGRATIONS = [
+    (1, 'baseline schema', baseline_schema),
+    (2, 'integer epoch timestamps', epoch_timestamps),
+    (3, 'category and subcategory lookup tables', category_lookup_tables),
+    (4, 'stock_data and rollup indexes', indexes),
+    (5, 'crawl jobs', crawl_jobs),
+    (6, 'crawl job scope and leases', crawl_leases),
+    (7, 'stock events and sales velocity', stock_events),
+    (8, 'crawl runs and request timings', crawl_timings),
+]
+
+def get_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+# Apply every migration newer than the database's version and return the
+# list of (version, name) applied
+def migrate(conn, log=None):
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.commit()
+    # Manage transactions explicitly so DDL is rolled back with the data
+    conn.isolation_level = None
+    try:
+        for version, name, apply in MIGRATIONS:
+            if version <= get_version(conn):
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            # Another process may have applied it while we waited for the lock
+            if version <= get_version(conn):
+                conn.execute('COMMIT')
+                continue
+            try:
+                apply(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append((version, name))
+            if log:
+                log(f"Applied migration {version}: {name}")
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(path)
+    print(f"{path} is at schema version {get_version(conn)}")
+    applied = migrate(conn, log=print)
+    if not applied:
+        print("Already up to date.")
+    conn.close()
@@ -0,0 +1,123 @@
+import time
+from database import DB_PATH, get_connection, setup_database, set_last_scrape, get_subcategory_id, from_epoch
+from rollups import ensure_rollup, refresh_rollup
+from events import update_events
+from archive import export_archive
+
+# Buffers scraped items and writes them to SQLite in batched transactions.
+# product_link -> id is loaded once and kept in memory, so a batch costs one
+# executemany for new products and one for the stock rows.
+class SQLiteWriterPipeline:
+    def __init__(self, db_path=DB_PATH, batch_size=50, archive=True):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.archive = archive
+        self.buffer = []
+        self.product_ids = {}
+        self.subcategory_ids = {}
+        self.first_date = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            db_path=crawler.settings.get('DB_PATH', DB_PATH),
+            batch_size=crawler.settings.getint('DB_BATCH_SIZE', 50),
+            archive=crawler.settings.getbool('ARCHIVE_EXPORT', True)
+        )
+
+    def open_spider(self, spider):
+        self.conn = get_connection(self.db_path)
+        setup_database(self.conn)
+        self.product_ids = {
+            link: product_id
+            for product_id, link in self.conn.execute('SELECT id, product_link FROM product_info')
+        }
+
+    def process_item(self, item, spider):
+        self.buffer.append(item)
+        if self.first_date is None or item['date'] < self.first_date:
+            self.first_date = item['date']
+        if len(self.buffer) >= self.batch_size:
+            self.flush(spider)
+        return item
+
+    def flush(self, spider):
+        if not self.buffer:
+            return
+        items, self.buffer = self.buffer, []
+
+        started = time.perf_counter()
+        with self.conn:
+            new_products = {}
+            for item in items:
+                if item['product_link'] not in self.product_ids:
+                    new_products[item['product_link']] = (
+                        get_subcategory_id(self.conn, item['category'], item['subcategory'], self.subcategory_ids),
+                        item['product_name'],
+                        item['product_link']
+                    )
+            if new_products:
+                self.conn.executemany('''
+                    INSERT OR IGNORE INTO product_info (subcategory_id, product_name, product_link)
+                    VALUES (?, ?, ?)
+                ''', list(new_products.values()))
+                placeholders = ','.join('?' * len(new_products))
+                for product_id, link in self.conn.execute(
+                    f'SELECT id, product_link FROM product_info WHERE product_link IN ({placeholders})',
+                    list(new_products)
+                ):
+                    self.product_ids[link] = product_id
+
+            # Unchanged products from an incremental crawl get no new row
+            changed = [item for item in items if not item.get('unchanged')]
+            self.conn.executemany('''
+                INSERT INTO stock_data (product_id, date, stock_amount, price)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (self.product_ids[item['product_link']], item['date'], item['stock_amount'], item['price'])
+                for item in changed
+            ])
+
+            # Record validators and the check time for every product crawled
+            self.conn.executemany('''
+                INSERT INTO crawl_state (product_id, etag, last_modified, content_hash, checked_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    etag = COALESCE(excluded.etag, etag),
+                    last_modified = COALESCE(excluded.last_modified, last_modified),
+                    content_hash = COALESCE(excluded.content_hash, content_hash),
+                    checked_at = excluded.checked_at
+            ''', [
+                (self.product_ids[item['product_link']], item.get('etag'), item.get('last_modified'),
+                 item.get('content_hash'), item['date'])
+                for item in items
+            ])
+
+        # One timing per batch; items is the number of rows it wrote
+        timings = getattr(spider, 'timings', None)
+        if timings:
+            timings.record('db_write', None, time.perf_counter() - started, items=len(items))
+
+        # Rows are committed, so the browser pool can attach screenshots to them
+        pool = getattr(spider, 'screenshot_pool', None)
+        if pool:
+            for item in changed:
+                pool.submit(item['url'], self.product_ids[item['product_link']], item['date'])
+
+    def close_spider(self, spider):
+        self.flush(spider)
+        # Bring the Product Overview rollup up to date for the days this run touched
+        if self.first_date:
+            ensure_rollup(self.conn)
+            refresh_rollup(self.conn, since_day=from_epoch(self.first_date).strftime('%Y-%m-%d'))
+            # Detect restocks, drops and price changes in the new rows
+            update_events(self.conn)
+            # Append the new rows to the Parquet archive read by load_history
+            if self.archive:
+                try:
+                    export_archive(self.conn, log=spider.logger.info)
+                except Exception as e:
+                    spider.logger.error(f"Archive export failed: {str(e)}")
+            # New version stamp so the UI drops its cached query results
+            set_last_scrape(self.conn)
+        self.conn.close()
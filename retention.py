@@ -0,0 +1,226 @@
+import argparse
+import io
+from datetime import datetime
+import pandas as pd
+from PIL import Image
+from database import DB_PATH, get_connection, setup_database, now_epoch, local_seconds
+from screenshot_store import STORE_PATH, get_store_connection, put_screenshot
+
+# Keep every capture for keep_all_days, then the first capture per product
+# per day until daily_days, then the first per product per week. Images whose
+# newest capture is older than recompress_after_days are downsampled to
+# recompress_max_size and re-encoded at recompress_quality.
+RETENTION_POLICY = {
+    'keep_all_days': 7,
+    'daily_days': 90,
+    'recompress_after_days': 30,
+    'recompress_max_size': (1024, 768),
+    'recompress_quality': 50,
+}
+# Images stored this recently are never removed, as a screenshot worker may
+# not have written its reference to stock_data yet
+GC_GRACE_SECONDS = 3600
+BATCH_SIZE = 500
+VACUUM_STEP_PAGES = 1000
+
+def batches(values, size=BATCH_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# Every stock_data row with a screenshot, flagged with whether the policy
+# keeps it. Only the screenshot reference of a dropped row is cleared; the
+# stock and price columns are never touched.
+def plan_captures(conn, policy, now):
+    captures = pd.read_sql_query('''
+        SELECT id, product_id, date, screenshot_hash,
+            CASE WHEN screenshot IS NOT NULL THEN length(screenshot) ELSE 0 END AS inline_size
+        FROM stock_data
+        WHERE screenshot_hash IS NOT NULL OR screenshot IS NOT NULL
+        ORDER BY product_id, date, id
+    ''', conn)
+    age_days = (now - captures['date']) / 86400
+    day = local_seconds(captures['date']) // 86400
+    # 1970-01-01 was a Thursday; shift so weeks start on Monday
+    week = (day + 3) // 7
+    # Rows in the keep-all tier get a bucket of their own
+    captures['bucket'] = -captures['id']
+    captures.loc[age_days >= policy['keep_all_days'], 'bucket'] = day
+    captures.loc[age_days >= policy['daily_days'], 'bucket'] = 10 ** 7 + week
+    captures['keep'] = ~captures.duplicated(['product_id', 'bucket'], keep='first')
+    return captures
+
+# Store images no kept capture refers to, older than the grace period
+def plan_unreferenced(store, referenced, now):
+    store.execute('CREATE TEMP TABLE IF NOT EXISTS referenced (hash TEXT PRIMARY KEY)')
+    store.execute('DELETE FROM referenced')
+    store.executemany('INSERT OR IGNORE INTO referenced (hash) VALUES (?)', ((digest,) for digest in referenced))
+    cutoff = datetime.fromtimestamp(now - GC_GRACE_SECONDS).strftime('%Y-%m-%d %H:%M:%S')
+    rows = store.execute('''
+        SELECT s.hash, s.size FROM screenshots s
+        LEFT JOIN referenced r ON r.hash = s.hash
+        WHERE r.hash IS NULL AND s.created_at < ?
+    ''', (cutoff,)).fetchall()
+    store.execute('DELETE FROM referenced')
+    return rows
+
+def recompress_image(data, policy):
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    image.thumbnail(policy['recompress_max_size'])
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=policy['recompress_quality'], optimize=True)
+    return buffer.getvalue()
+
+# Kept images whose newest capture is past recompress_after_days and that
+# were not recompressed before
+def plan_recompression(store, kept, policy, now):
+    cutoff = now - policy['recompress_after_days'] * 86400
+    newest = kept.dropna(subset=['screenshot_hash']).groupby('screenshot_hash')['date'].max()
+    old = set(newest[newest < cutoff].index)
+    if not old:
+        return []
+    candidates = []
+    for batch in batches(sorted(old)):
+        placeholders = ','.join('?' * len(batch))
+        candidates += store.execute(
+            f'SELECT hash, size FROM screenshots WHERE recompressed = 0 AND hash IN ({placeholders})', batch
+        ).fetchall()
+    return candidates
+
+def free_bytes(conn):
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size
+
+# Return free pages to the file system a step at a time, so other
+# connections are only blocked briefly. A database not yet in incremental
+# auto_vacuum mode is switched over with one full VACUUM.
+def incremental_vacuum(conn, log):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        log("Switching to incremental auto_vacuum (one-time full VACUUM)...")
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return
+    steps = conn.execute('PRAGMA freelist_count').fetchone()[0] // VACUUM_STEP_PAGES + 1
+    for _ in range(steps):
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})').fetchall()
+        conn.commit()
+
+def format_bytes(value):
+    return f"{value / 1024 / 1024:.1f} MB"
+
+# Apply the policy, or with dry_run only report what it would reclaim
+def run_retention(db_path=DB_PATH, store_path=STORE_PATH, policy=RETENTION_POLICY, dry_run=True, log=print):
+    conn = get_connection(db_path)
+    setup_database(conn)
+    store = get_store_connection(store_path)
+    now = now_epoch()
+    rows_before = conn.execute('SELECT COUNT(*) FROM stock_data').fetchone()[0]
+
+    captures = plan_captures(conn, policy, now)
+    dropped = captures[~captures['keep']]
+    kept = captures[captures['keep']]
+    referenced = set(kept['screenshot_hash'].dropna())
+    unreferenced = plan_unreferenced(store, referenced, now)
+    recompress = plan_recompression(store, kept, policy, now)
+
+    report = {
+        'captures': len(captures),
+        'captures_dropped': len(dropped),
+        'inline_bytes': int(dropped['inline_size'].sum()),
+        'images_deleted': len(unreferenced),
+        'image_bytes': sum(size for _, size in unreferenced),
+        'images_recompressed': 0,
+        'recompress_bytes': 0,
+        'free_bytes': free_bytes(conn) + free_bytes(store),
+    }
+
+    # Recompress in memory for an exact saving, writing only when applying
+    remap = []
+    for digest, size in recompress:
+        data = store.execute('SELECT data FROM screenshots WHERE hash = ?', (digest,)).fetchone()[0]
+        smaller = recompress_image(data, policy)
+        if len(smaller) >= size:
+            if not dry_run:
+                store.execute('UPDATE screenshots SET recompressed = 1 WHERE hash = ?', (digest,))
+            continue
+        report['images_recompressed'] += 1
+        report['recompress_bytes'] += size - len(smaller)
+        if not dry_run:
+            thumbnail = store.execute('SELECT data FROM thumbnails WHERE hash = ?', (digest,)).fetchone()
+            new_digest = put_screenshot(store, smaller, commit=False, thumbnail=thumbnail[0] if thumbnail else None, recompressed=True)
+            remap.append((digest, new_digest))
+    store.commit()
+
+    log(f"{'Dry run: ' if dry_run else ''}retention policy {policy}")
+    log(f"  {report['captures_dropped']} of {report['captures']} captures dropped "
+        f"({format_bytes(report['inline_bytes'])} stored inline in stock_data)")
+    log(f"  {report['images_deleted']} unreferenced images deleted ({format_bytes(report['image_bytes'])})")
+    log(f"  {report['images_recompressed']} images recompressed (saves {format_bytes(report['recompress_bytes'])})")
+    log(f"  {format_bytes(report['free_bytes'])} already free inside the database files")
+    total = report['inline_bytes'] + report['image_bytes'] + report['recompress_bytes'] + report['free_bytes']
+    log(f"  Total reclaimable: {format_bytes(total)}")
+
+    if dry_run:
+        store.close()
+        conn.close()
+        return report
+
+    # Clear the references of dropped captures; the rows themselves stay
+    for batch in batches(dropped['id'].tolist()):
+        placeholders = ','.join('?' * len(batch))
+        with conn:
+            conn.execute(
+                f'UPDATE stock_data SET screenshot_hash = NULL, screenshot = NULL WHERE id IN ({placeholders})', batch
+            )
+
+    # Point captures at the recompressed images in one pass over stock_data;
+    # the originals are then unreferenced and removed below
+    if remap:
+        conn.execute('CREATE TEMP TABLE remap (old TEXT PRIMARY KEY, new TEXT)')
+        with conn:
+            conn.executemany('INSERT INTO remap (old, new) VALUES (?, ?)', remap)
+            conn.execute('''
+                UPDATE stock_data SET screenshot_hash = (SELECT new FROM remap WHERE old = stock_data.screenshot_hash)
+                WHERE screenshot_hash IN (SELECT old FROM remap)
+            ''')
+        conn.execute('DROP TABLE remap')
+
+    # Re-check references just before deleting: a capture taken meanwhile may
+    # have stored an identical image, which also refreshes its created_at
+    referenced = {row[0] for row in conn.execute('SELECT DISTINCT screenshot_hash FROM stock_data WHERE screenshot_hash IS NOT NULL')}
+    cutoff = datetime.fromtimestamp(now - GC_GRACE_SECONDS).strftime('%Y-%m-%d %H:%M:%S')
+    candidates = [digest for digest, _ in unreferenced] + [digest for digest, _ in remap]
+    for batch in batches([(digest, cutoff) for digest in candidates if digest not in referenced]):
+        store.executemany('DELETE FROM screenshots WHERE hash = ? AND created_at < ?', batch)
+        store.commit()
+    with store:
+        store.execute('DELETE FROM thumbnails WHERE hash NOT IN (SELECT hash FROM screenshots)')
+
+    rows_after = conn.execute('SELECT COUNT(*) FROM stock_data').fetchone()[0]
+    if rows_after < rows_before:
+        raise RuntimeError(f"stock_data lost rows during retention ({rows_before} -> {rows_after})")
+
+    incremental_vacuum(conn, log)
+    incremental_vacuum(store, log)
+    log("Retention applied.")
+    store.close()
+    conn.close()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thin out and recompress old screenshots, then compact the databases.")
+    parser.add_argument('--apply', action='store_true', help="Apply the policy (default: dry-run report only)")
+    parser.add_argument('--keep-all-days', type=int, default=RETENTION_POLICY['keep_all_days'])
+    parser.add_argument('--daily-days', type=int, default=RETENTION_POLICY['daily_days'])
+    parser.add_argument('--recompress-after-days', type=int, default=RETENTION_POLICY['recompress_after_days'])
+    parser.add_argument('--quality', type=int, default=RETENTION_POLICY['recompress_quality'])
+    parser.add_argument('--max-width', type=int, default=RETENTION_POLICY['recompress_max_size'][0])
+    args = parser.parse_args()
+
+    policy = {
+        'keep_all_days': args.keep_all_days,
+        'daily_days': args.daily_days,
+        'recompress_after_days': args.recompress_after_days,
+        'recompress_max_size': (args.max_width, args.max_width * 3 // 4),
+        'recompress_quality': args.quality,
+    }
+    run_retention(policy=policy, dry_run=not args.apply)
@@ -0,0 +1,157 @@
+import sys
+import pandas as pd
+from datetime import datetime
+from database import DB_PATH, get_connection, setup_database, to_epoch
+
+# Recompute the per-product, per-day rollup for every day from since_day on.
+# Incremental crawls that found nothing changed count as a sample of the last
+# stored values on the day they were checked, matching the carried-forward
+# rows shown in the charts. With no since_day the whole table is rebuilt.
+def refresh_rollup(conn, since_day=None):
+    since_day = since_day or '1970-01-01'
+    since = to_epoch(datetime.strptime(since_day, '%Y-%m-%d'))
+    with conn:
+        conn.execute('DELETE FROM daily_rollup WHERE day >= ?', (since_day,))
+        conn.execute('''
+            INSERT INTO daily_rollup
+            WITH src AS (
+                SELECT product_id, date, stock_amount, price
+                FROM stock_data
+                WHERE date >= :since
+                UNION ALL
+                SELECT cs.product_id, cs.checked_at, sd.stock_amount, sd.price
+                FROM crawl_state cs
+                JOIN stock_data sd ON sd.id = (SELECT MAX(id) FROM stock_data WHERE product_id = cs.product_id)
+                WHERE cs.checked_at > sd.date AND cs.checked_at >= :since
+            ), ranked AS (
+                SELECT product_id, date(date, 'unixepoch', 'localtime') AS day, date, stock_amount, price,
+                    ROW_NUMBER() OVER (PARTITION BY product_id, date(date, 'unixepoch', 'localtime') ORDER BY date) AS first_rank,
+                    ROW_NUMBER() OVER (PARTITION BY product_id, date(date, 'unixepoch', 'localtime') ORDER BY date DESC) AS last_rank
+                FROM src
+            )
+            SELECT product_id, day,
+                MAX(CASE WHEN first_rank = 1 THEN stock_amount END),
+                MAX(CASE WHEN last_rank = 1 THEN stock_amount END),
+                MIN(stock_amount), MAX(stock_amount),
+                MAX(CASE WHEN first_rank = 1 THEN price END),
+                MAX(CASE WHEN last_rank = 1 THEN price END),
+                MIN(price), MAX(price),
+                COUNT(*), MIN(date), MAX(date)
+            FROM ranked
+            GROUP BY product_id, day
+        ''', {'since': since})
+
+# Build the rollup from scratch when the table is missing or empty
+def ensure_rollup(conn):
+    setup_database(conn)
+    if conn.execute('SELECT 1 FROM daily_rollup LIMIT 1').fetchone() is None:
+        refresh_rollup(conn)
+
+def rollup_date_range(conn):
+    return conn.execute('SELECT MIN(day), MAX(day) FROM daily_rollup').fetchone()
+
+# First and last stock/price per product over [start_day, end_day]: the
+# first and last day of each product in the window, then two primary key
+# lookups per product instead of ranking every rollup row in the window
+WINDOW_QUERY = '''
+    WITH bounds AS (
+        SELECT product_id, MIN(day) AS first_day, MAX(day) AS last_day
+        FROM daily_rollup
+        WHERE day BETWEEN :start_day AND :end_day
+        GROUP BY product_id
+    ), per_product AS (
+        SELECT b.product_id, f.first_stock AS initial_stock, l.last_stock AS final_stock,
+            f.first_price AS initial_price, l.last_price AS current_price
+        FROM bounds b
+        JOIN daily_rollup f ON f.product_id = b.product_id AND f.day = b.first_day
+        JOIN daily_rollup l ON l.product_id = b.product_id AND l.day = b.last_day
+    )
+'''
+
+# The Product Overview grid, computed in SQL so only the requested page is
+# read into pandas and sent to the browser. Products missing a stock or price
+# at either end of the window are left out, as are percentages of a zero start.
+OVERVIEW_QUERY = WINDOW_QUERY + '''
+    , overview AS (
+        SELECT pi.category, pi.subcategory, pi.product_name, w.initial_stock, w.final_stock,
+            w.final_stock - w.initial_stock AS stock_change,
+            ROUND((w.final_stock - w.initial_stock) * 100.0 / NULLIF(w.initial_stock, 0), 2) AS stock_change_percentage,
+            w.initial_price, w.current_price,
+            ROUND(w.current_price - w.initial_price, 2) AS price_change,
+            ROUND((w.current_price - w.initial_price) * 100.0 / NULLIF(w.initial_price, 0), 2) AS price_change_percentage
+        FROM per_product w
+        JOIN products pi ON pi.id = w.product_id
+        WHERE w.initial_stock IS NOT NULL AND w.final_stock IS NOT NULL
+            AND w.initial_price IS NOT NULL AND w.current_price IS NOT NULL
+    )
+'''
+OVERVIEW_COLUMNS = [
+    'category', 'subcategory', 'product_name', 'initial_stock', 'final_stock', 'stock_change',
+    'stock_change_percentage', 'initial_price', 'current_price', 'price_change', 'price_change_percentage'
+]
+GROUP_LEVELS = {'category': ['category'], 'subcategory': ['category', 'subcategory']}
+
+# filters: category, subcategory, search (part of the product name) and
+# min_change_pct (smallest absolute stock change percentage)
+def _overview_where(filters):
+    where, params = [], {}
+    if filters.get('category'):
+        where.append('category = :category')
+        params['category'] = filters['category']
+    if filters.get('subcategory'):
+        where.append('subcategory = :subcategory')
+        params['subcategory'] = filters['subcategory']
+    if filters.get('search'):
+        where.append("product_name LIKE :search ESCAPE '\\'")
+        escaped = filters['search'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params['search'] = f'%{escaped}%'
+    if filters.get('min_change_pct'):
+        where.append('ABS(stock_change_percentage) >= :min_change_pct')
+        params['min_change_pct'] = filters['min_change_pct']
+    return ' AND '.join(where) or '1', params
+
+# One page of the overview, sorted on any column. The default order is the
+# largest absolute stock change percentage first.
+def query_overview(conn, start_day, end_day, filters=None, sort=None, descending=True, page=1, page_size=50):
+    if sort is not None and sort not in OVERVIEW_COLUMNS:
+        raise ValueError(f"Unknown overview column: {sort}")
+    where, params = _overview_where(filters or {})
+    order = f"{sort} {'DESC' if descending else 'ASC'}" if sort else 'ABS(stock_change_percentage) DESC'
+    query = OVERVIEW_QUERY + f'''
+    SELECT {', '.join(OVERVIEW_COLUMNS)} FROM overview
+    WHERE {where}
+    ORDER BY {order} NULLS LAST, product_name
+    LIMIT :limit OFFSET :offset
+    '''
+    params.update(start_day=str(start_day), end_day=str(end_day), limit=page_size, offset=(page - 1) * page_size)
+    return pd.read_sql_query(query, conn, params=params)
+
+# Totals per category (level='category') or per subcategory of the filtered
+# overview. The percentages are of the group's summed starting stock and
+# the mean of its products' price changes.
+def overview_groups(conn, start_day, end_day, filters=None, level='category'):
+    columns = ', '.join(GROUP_LEVELS[level])
+    where, params = _overview_where(filters or {})
+    query = OVERVIEW_QUERY + f'''
+    SELECT {columns}, COUNT(*) AS products,
+        SUM(initial_stock) AS initial_stock, SUM(final_stock) AS final_stock, SUM(stock_change) AS stock_change,
+        ROUND(SUM(stock_change) * 100.0 / NULLIF(SUM(initial_stock), 0), 2) AS stock_change_percentage,
+        ROUND(AVG(price_change_percentage), 2) AS avg_price_change_percentage
+    FROM overview
+    WHERE {where}
+    GROUP BY {columns}
+    ORDER BY {columns}
+    '''
+    params.update(start_day=str(start_day), end_day=str(end_day))
+    return pd.read_sql_query(query, conn, params=params)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+        conn = get_connection(DB_PATH)
+        setup_database(conn)
+        refresh_rollup(conn)
+        count = conn.execute('SELECT COUNT(*) FROM daily_rollup').fetchone()[0]
+        conn.close()
+        print(f"Rebuilt daily_rollup: {count} product-days.")
+    else:
+        print("Usage: python rollups.py rebuild")
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from database import to_epoch
+from jobs import ACTIVE_STATUSES, open_jobs_db, start_job, cancel_job, reap_jobs, get_status, now
+
+DATA_PATH = 'product_data.json'
+SCHEDULE_PATH = 'schedule.json'
+# Used when there is no schedule.json: every category every 6 hours
+DEFAULT_SCHEDULE = {
+    'default': {'cron': '0 */6 * * *', 'profile': 'default', 'incremental': True, 'workers': 1},
+}
+# Leases are renewed on every poll and expire this long after the scheduler
+# holding them stops renewing, so a crashed scheduler never blocks a crawl
+LEASE_SECONDS = 600
+
+# minute, hour, day of month, month, day of week (0 or 7 = Sunday)
+CRON_FIELDS = [('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7)]
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+# Parse a five-field cron expression into the set of allowed values per field
+def parse_cron(expression):
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression needs 5 fields: {expression}")
+    cron = {name: parse_cron_field(field, low, high) for field, (name, low, high) in zip(fields, CRON_FIELDS)}
+    if 7 in cron['weekday']:
+        cron['weekday'].add(0)
+    # As in cron, a restricted day of month and day of week match either
+    cron['any_day'] = fields[2] == '*'
+    cron['any_weekday'] = fields[4] == '*'
+    return cron
+
+def day_matches(cron, value):
+    day = value.day in cron['day']
+    weekday = (value.weekday() + 1) % 7 in cron['weekday']
+    if cron['any_day'] or cron['any_weekday']:
+        return day and weekday
+    return day or weekday
+
+# The first minute after `after` that the cron expression matches
+def next_run(cron, after):
+    value = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = value + timedelta(days=5 * 366)
+    while value < limit:
+        if value.month not in cron['month']:
+            value = (value.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+        elif not day_matches(cron, value):
+            value = (value + timedelta(days=1)).replace(hour=0, minute=0)
+        elif value.hour not in cron['hour']:
+            value = (value + timedelta(hours=1)).replace(minute=0)
+        elif value.minute not in cron['minute']:
+            value += timedelta(minutes=1)
+        else:
+            return value
+    raise ValueError("Cron expression never matches")
+
+# Schedule entries from schedule.json. Categories listed under "categories"
+# get their own entry (inheriting unset options from "default"); "default"
+# covers every other category and the optional "discover" entry refreshes
+# the catalogue.
+def load_schedule(path=SCHEDULE_PATH):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            schedule = json.load(f)
+    else:
+        schedule = DEFAULT_SCHEDULE
+    default = {'profile': 'default', 'incremental': False, 'workers': 1, **schedule.get('default', {})}
+    overrides = schedule.get('categories', {})
+
+    entries = []
+    if 'cron' in default:
+        entries.append({**default, 'name': 'default', 'categories': None, 'exclude': list(overrides), 'scrape': True})
+    for category, options in overrides.items():
+        entries.append({**default, **options, 'name': category, 'categories': [category], 'scrape': True})
+    if 'discover' in schedule:
+        entries.append({'profile': 'default', **schedule['discover'], 'name': 'discover', 'workers': 1, 'scrape': False})
+    for entry in entries:
+        entry['schedule'] = parse_cron(entry['cron'])
+    return entries
+
+# Take the lease for a scheduled slot. Fails while another scheduler holds
+# an unexpired lease, or when the slot (or a later one) was already run.
+def acquire_lease(conn, name, owner, slot):
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO crawl_leases (name, expires_at) VALUES (?, 0)', (name,))
+        cursor = conn.execute('''
+            UPDATE crawl_leases SET owner = ?, expires_at = ?, last_slot = ?
+            WHERE name = ? AND expires_at < ? AND (last_slot IS NULL OR last_slot < ?)
+        ''', (owner, now() + LEASE_SECONDS, slot, name, now(), slot))
+    return cursor.rowcount == 1
+
+def renew_lease(conn, name, owner):
+    with conn:
+        conn.execute(
+            'UPDATE crawl_leases SET expires_at = ? WHERE name = ? AND owner = ?', (now() + LEASE_SECONDS, name, owner)
+        )
+
+def release_lease(conn, name, owner):
+    with conn:
+        conn.execute('UPDATE crawl_leases SET expires_at = 0 WHERE name = ? AND owner = ?', (name, owner))
+
+def log(message):
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+# Start the jobs for one schedule entry, one per shard, and return their ids
+def launch(entry, workers):
+    categories = entry['categories']
+    if entry['scrape'] and categories is None:
+        with open(DATA_PATH, 'r', encoding='utf-8') as f:
+            categories = [category for category in json.load(f) if category not in entry['exclude']]
+        if not categories:
+            return []
+    shards = workers if entry['scrape'] else 1
+    return [
+        start_job(
+            entry['profile'], entry.get('incremental', False), discover=not entry['scrape'],
+            categories=categories, shard=shard if shards > 1 else None, shards=shards, scrape=entry['scrape']
+        )
+        for shard in range(shards)
+    ]
+
+# Run the schedule until interrupted. With once=True every entry is run
+# immediately and the scheduler exits when they finish.
+def run_scheduler(entries, workers=None, poll_interval=15, once=False):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    conn = open_jobs_db()
+    started = datetime.now()
+    next_runs = {entry['name']: started if once else next_run(entry['schedule'], started) for entry in entries}
+    running = {}
+    log(f"Scheduler {owner} started with {len(entries)} entries")
+    for entry in entries:
+        log(f"  {entry['name']}: '{entry['cron']}', next run {next_runs[entry['name']]:%Y-%m-%d %H:%M}")
+
+    try:
+        while True:
+            reap_jobs(conn)
+            for name, job_ids in list(running.items()):
+                statuses = [get_status(conn, job_id) for job_id in job_ids]
+                if any(status in ACTIVE_STATUSES for status in statuses):
+                    renew_lease(conn, f'crawl:{name}', owner)
+                    continue
+                release_lease(conn, f'crawl:{name}', owner)
+                del running[name]
+                log(f"{name}: jobs {', '.join(map(str, job_ids))} ended ({', '.join(statuses)})")
+
+            current = datetime.now()
+            for entry in entries:
+                name = entry['name']
+                if next_runs.get(name) is None or current < next_runs[name]:
+                    continue
+                slot = to_epoch(next_runs[name].replace(second=0, microsecond=0))
+                next_runs[name] = None if once else next_run(entry['schedule'], current)
+                if name in running:
+                    log(f"{name}: previous run still going, skipping this slot")
+                elif not acquire_lease(conn, f'crawl:{name}', owner, slot):
+                    log(f"{name}: slot already taken by another scheduler, skipping")
+                else:
+                    job_ids = launch(entry, workers or entry.get('workers', 1))
+                    if job_ids:
+                        running[name] = job_ids
+                        log(f"{name}: started jobs {', '.join(map(str, job_ids))}")
+                    else:
+                        release_lease(conn, f'crawl:{name}', owner)
+
+            if once and not running and all(value is None for value in next_runs.values()):
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        log("Stopping, cancelling running jobs...")
+        for name, job_ids in running.items():
+            for job_id in job_ids:
+                cancel_job(job_id)
+            release_lease(conn, f'crawl:{name}', owner)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scheduled crawls from schedule.json.")
+    parser.add_argument('--schedule', default=SCHEDULE_PATH, help="Schedule file (default: schedule.json)")
+    parser.add_argument('--workers', type=int, help="Crawl processes per entry, overriding the schedule")
+    parser.add_argument('--poll', type=float, default=15, help="Seconds between schedule checks")
+    parser.add_argument('--once', action='store_true', help="Run every entry now and exit when done")
+    parser.add_argument('--list', action='store_true', help="Print the schedule and next run times, then exit")
+    args = parser.parse_args()
+
+    entries = load_schedule(args.schedule)
+    if args.list:
+        for entry in entries:
+            print(f"{entry['name']}: '{entry['cron']}' profile={entry['profile']} "
+                  f"workers={args.workers or entry.get('workers', 1)} next={next_run(entry['schedule'], datetime.now()):%Y-%m-%d %H:%M}")
+    else:
+        run_scheduler(entries, args.workers, args.poll, args.once)
@@ -0,0 +1,121 @@
+import io
+import re
+import sqlite3
+import threading
+import time
+from queue import Queue
+from urllib.parse import urlparse
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from PIL import Image
+from database import DB_PATH
+from extractors import get_rules
+from screenshot_store import get_store_connection, put_screenshot, make_thumbnail
+
+def create_driver():
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    return webdriver.Chrome(options=chrome_options)
+
+# True once every field the extractors read (stock, price) is on the page
+# with a value, so late-rendered content is in the capture. A field whose
+# block (the first part of its selector) is not on the page at all, like the
+# stock of a product without stock info, does not hold the capture up, but
+# at least one field must have rendered.
+def fields_rendered(driver, rules):
+    rendered = False
+    for rule in rules.values():
+        elements = driver.find_elements(By.CSS_SELECTOR, rule['css'])
+        if not elements:
+            if driver.find_elements(By.CSS_SELECTOR, rule['css'].split()[0]):
+                return False
+            continue
+        # textContent, since the stock text sits in a collapsed block that .text skips
+        if not re.search(rule['regex'], elements[0].get_attribute('textContent') or ''):
+            return False
+        rendered = True
+    return rendered
+
+def capture(driver, url, timeout=3):
+    # get() returns once the document has loaded; then wait briefly for the
+    # site's stock and price, capturing whatever is shown if they never appear
+    driver.get(url)
+    rules = get_rules(urlparse(url).hostname)
+    try:
+        WebDriverWait(driver, timeout, ignored_exceptions=(StaleElementReferenceException,)).until(
+            lambda d: fields_rendered(d, rules)
+        )
+    except TimeoutException:
+        pass
+    screenshot = driver.get_screenshot_as_png()
+    image = Image.open(io.BytesIO(screenshot))
+    image = image.convert('RGB')
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG', quality=70)
+    # Build the thumbnail from the decoded capture so the JPEG is not decoded again
+    return img_byte_arr.getvalue(), make_thumbnail(image=image)
+
+# A fixed pool of headless browsers fed from a queue. Each worker owns its own
+# driver and database connections and writes the screenshot reference back to
+# the stock_data row for the scrape it was submitted for. record(stage, url,
+# seconds, status, error) is called with the time of every capture and
+# captured counts the screenshots written.
+class ScreenshotPool:
+    def __init__(self, workers=2, timeout=3, db_path=DB_PATH, log=None, record=None):
+        self.timeout = timeout
+        self.db_path = db_path
+        self.log = log or (lambda message: None)
+        self.record = record or (lambda *args: None)
+        self.captured = 0
+        self.lock = threading.Lock()
+        self.tasks = Queue()
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, url, product_id, date):
+        self.tasks.put((url, product_id, date))
+
+    def _worker(self):
+        try:
+            driver = create_driver()
+        except Exception as e:
+            self.log(f"Could not start browser worker: {str(e)}")
+            return
+        store = get_store_connection()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    break
+                url, product_id, date = task
+                started = time.perf_counter()
+                try:
+                    data, thumbnail = capture(driver, url, self.timeout)
+                    screenshot_hash = put_screenshot(store, data, thumbnail=thumbnail)
+                    conn.execute(
+                        'UPDATE stock_data SET screenshot_hash = ? WHERE product_id = ? AND date = ?',
+                        (screenshot_hash, product_id, date)
+                    )
+                    conn.commit()
+                    with self.lock:
+                        self.captured += 1
+                    self.record('screenshot', url, time.perf_counter() - started)
+                except Exception as e:
+                    self.log(f"Screenshot failed for {url}: {str(e)}")
+                    self.record('screenshot', url, time.perf_counter() - started, 'error', str(e))
+        finally:
+            driver.quit()
+            store.close()
+            conn.close()
+
+    # Wait for all queued captures to finish and shut the browsers down
+    def close(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,157 @@
+import hashlib
+import io
+import sqlite3
+import sys
+from datetime import datetime
+from PIL import Image
+from migrations import migrate as migrate_schema, ensure_column
+
+DB_PATH = 'product_database.db'
+STORE_PATH = 'screenshot_store.db'
+THUMBNAIL_SIZE = (320, 240)
+
+# Screenshots live in their own SQLite file, keyed by the SHA-256 of the image
+# bytes, so identical captures are stored once and stock_data stays small.
+def get_store_connection(path=STORE_PATH):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS screenshots (
+            hash TEXT PRIMARY KEY,
+            data BLOB,
+            size INTEGER,
+            created_at TEXT
+        )
+    ''')
+    # Set on images already downsampled by the retention job
+    ensure_column(conn, 'screenshots', 'recompressed', 'INTEGER DEFAULT 0')
+    # Small JPEG previews keyed by the same hash, for the thumbnail strip
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            hash TEXT PRIMARY KEY,
+            data BLOB
+        )
+    ''')
+    conn.commit()
+    return conn
+
+def screenshot_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# JPEG thumbnail of a screenshot, from its bytes or an already decoded image
+def make_thumbnail(data=None, image=None):
+    if image is None:
+        image = Image.open(io.BytesIO(data))
+    thumbnail = image.convert('RGB')
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=60)
+    return buffer.getvalue()
+
+# Store image bytes and their thumbnail and return the hash. A duplicate only
+# refreshes created_at, so the retention job's grace period also covers an
+# old image that was just captured again. The thumbnail is generated here
+# unless the caller already has it.
+def put_screenshot(conn, data, commit=True, thumbnail=None, recompressed=False):
+    digest = screenshot_hash(data)
+    conn.execute('''
+        INSERT INTO screenshots (hash, data, size, created_at, recompressed) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (hash) DO UPDATE SET created_at = excluded.created_at
+    ''', (digest, sqlite3.Binary(data), len(data), datetime.now().strftime('%Y-%m-%d %H:%M:%S'), int(recompressed)))
+    if conn.execute('SELECT 1 FROM thumbnails WHERE hash = ?', (digest,)).fetchone() is None:
+        conn.execute(
+            'INSERT INTO thumbnails (hash, data) VALUES (?, ?)',
+            (digest, sqlite3.Binary(thumbnail or make_thumbnail(data)))
+        )
+    if commit:
+        conn.commit()
+    return digest
+
+def get_screenshot(conn, digest):
+    row = conn.execute('SELECT data FROM screenshots WHERE hash = ?', (digest,)).fetchone()
+    if row:
+        return row[0]
+    return None
+
+# hash -> thumbnail bytes for the given hashes. Screenshots stored before
+# thumbnails existed get one generated and saved on first request.
+def get_thumbnails(conn, digests):
+    digests = list(dict.fromkeys(digests))
+    if not digests:
+        return {}
+    placeholders = ','.join('?' * len(digests))
+    thumbnails = dict(conn.execute(f'SELECT hash, data FROM thumbnails WHERE hash IN ({placeholders})', digests))
+    missing = [digest for digest in digests if digest not in thumbnails]
+    if missing:
+        placeholders = ','.join('?' * len(missing))
+        for digest, data in conn.execute(f'SELECT hash, data FROM screenshots WHERE hash IN ({placeholders})', missing).fetchall():
+            thumbnails[digest] = make_thumbnail(data)
+            conn.execute('INSERT OR IGNORE INTO thumbnails (hash, data) VALUES (?, ?)', (digest, sqlite3.Binary(thumbnails[digest])))
+        conn.commit()
+    return thumbnails
+
+# Generate thumbnails for every stored screenshot that has none
+def backfill_thumbnails(store_path=STORE_PATH, batch_size=100):
+    conn = get_store_connection(store_path)
+    created = 0
+    while True:
+        rows = conn.execute('''
+            SELECT s.hash, s.data FROM screenshots s
+            LEFT JOIN thumbnails t ON t.hash = s.hash
+            WHERE t.hash IS NULL
+            LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            'INSERT INTO thumbnails (hash, data) VALUES (?, ?)',
+            [(digest, sqlite3.Binary(make_thumbnail(data))) for digest, data in rows]
+        )
+        conn.commit()
+        created += len(rows)
+    conn.close()
+    print(f"Created {created} thumbnails in {store_path}.")
+    return created
+
+# Move screenshot BLOBs out of stock_data into the blob store
+def migrate(db_path=DB_PATH, store_path=STORE_PATH, batch_size=100):
+    conn = sqlite3.connect(db_path)
+    migrate_schema(conn)
+    cursor = conn.cursor()
+    store = get_store_connection(store_path)
+
+    moved = 0
+    last_id = 0
+    while True:
+        rows = cursor.execute('''
+            SELECT id, screenshot FROM stock_data
+            WHERE id > ? AND screenshot IS NOT NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = [(put_screenshot(store, data, commit=False), stock_id) for stock_id, data in rows]
+        # Commit the store first so a reference never points at a missing blob
+        store.commit()
+        cursor.executemany(
+            'UPDATE stock_data SET screenshot_hash = ?, screenshot = NULL WHERE id = ?', updates
+        )
+        conn.commit()
+        moved += len(rows)
+        last_id = rows[-1][0]
+
+    unique = store.execute('SELECT COUNT(*) FROM screenshots').fetchone()[0]
+    store.close()
+
+    # Reclaim the space freed by the moved BLOBs
+    conn.execute('VACUUM')
+    conn.close()
+    print(f"Moved {moved} screenshots into {store_path} ({unique} unique images).")
+    return moved
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        migrate()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'thumbnails':
+        backfill_thumbnails()
+    else:
+        print("Usage: python screenshot_store.py migrate|thumbnails")
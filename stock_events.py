@@ -0,0 +1,71 @@
+import streamlit as st
+import plotly.express as px
+from datetime import timedelta
+from data_access import data_version, load_products, load_date_bounds, load_events, load_velocity
+
+EVENT_LABELS = {'restock': 'Restock', 'drop': 'Sharp drop', 'price_change': 'Price change'}
+
+def main():
+    # Events are detected after each crawl; results are cached until the next one
+    version = data_version()
+    products_df = load_products(version)
+
+    st.title('Stock Events')
+
+    if products_df.empty:
+        st.warning('No data available. Please run the scraper to collect data.')
+        return
+
+    # Sidebar filters
+    st.sidebar.header('Filters')
+    categories = ['All'] + sorted(products_df['category'].unique())
+    selected_category = st.sidebar.selectbox('Category', categories)
+    category = None if selected_category == 'All' else selected_category
+    event_types = st.sidebar.multiselect(
+        'Event Types', list(EVENT_LABELS), default=list(EVENT_LABELS), format_func=EVENT_LABELS.get
+    )
+
+    min_date, max_date = load_date_bounds(version)
+    default_start_date = max(min_date, max_date - timedelta(days=7))
+    start_date = st.sidebar.date_input('Start Date', default_start_date, min_value=min_date, max_value=max_date)
+    end_date = st.sidebar.date_input('End Date', max_date, min_value=min_date, max_value=max_date)
+
+    if start_date > end_date:
+        st.sidebar.error('Error: End date must fall after start date.')
+        st.stop()
+
+    events = load_events(version, start_date, end_date, tuple(event_types), category)
+
+    # Event counts
+    col1, col2, col3 = st.columns(3)
+    for column, event_type in zip((col1, col2, col3), EVENT_LABELS):
+        column.metric(EVENT_LABELS[event_type] + 's', int((events['event_type'] == event_type).sum()))
+
+    st.subheader(f'Events ({start_date} to {end_date})')
+    if events.empty:
+        st.info('No events in the selected range.')
+    else:
+        daily = events.assign(day=events['date'].dt.date).groupby(['day', 'event_type']).size().reset_index(name='events')
+        daily['event_type'] = daily['event_type'].map(EVENT_LABELS)
+        fig = px.bar(daily, x='day', y='events', color='event_type',
+                     labels={'day': 'Date', 'events': 'Events', 'event_type': 'Event'})
+        st.plotly_chart(fig)
+
+        display_df = events.copy()
+        display_df['date'] = display_df['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        display_df['event_type'] = display_df['event_type'].map(EVENT_LABELS)
+        values = {'previous_value': '{:g}', 'value': '{:g}', 'change': '{:g}', 'change_pct': '{:.2f}'}
+        st.dataframe(display_df.style.format(values, na_rep='-'), hide_index=True)
+
+    # Products selling fastest, with how long their stock lasts at that rate
+    st.subheader('Sales Velocity (last 7 days)')
+    velocity = load_velocity(version, category)
+    if velocity.empty:
+        st.info('No sales velocity recorded yet.')
+    else:
+        # Products with a single scrape in the window have no rate yet
+        st.dataframe(velocity.style.format({'units_per_day': '{:.2f}', 'days_of_cover': '{:.1f}'}, na_rep='-'),
+                     hide_index=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,170 +1,249 @@
 import scrapy
 from scrapy.crawler import CrawlerProcess
-from bs4 import BeautifulSoup
+import argparse
 import json
-import re
-import sqlite3
-from datetime import datetime
+import hashlib
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import io
-from PIL import Image
 from queue import Queue
+from twisted.internet import threads
+from screenshot_pool import ScreenshotPool
+from crawl_profiles import get_crawl_settings
+from database import get_connection, load_crawl_state, set_last_scrape, now_epoch
+from extractors import extract_fields
+from catalogue_spider import CatalogueSpider
+from crawl_profiles import CRAWL_PROFILES
+from jobs import get_status, finish_job
+
+def content_hash(stock, price):
+    return hashlib.sha1(f"{stock}|{price}".encode('utf-8')).hexdigest()
+
+# Stable shard number of a product link, the same in every process
+def shard_of(link, shards):
+    return int(hashlib.sha1(link.encode('utf-8')).hexdigest()[:8], 16) % shards
 
 class StockSpider(scrapy.Spider):
     name = 'stock_spider'
+    # Set by the crawl_stats.RunRecorder extension to record stage timings
+    timings = None
     
-    def __init__(self, *args, message_queue=None, **kwargs):
+    def __init__(self, *args, message_queue=None, incremental=False, categories=None, shard=None, shards=1, **kwargs):
         super(StockSpider, self).__init__(*args, **kwargs)
-        self.conn = sqlite3.connect('product_database.db')
-        self.cursor = self.conn.cursor()
-        self.setup_database()
-        self.current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.current_datetime = now_epoch()
         self.message_queue = message_queue
+        self.incremental = incremental
+        self.crawl_state = {}
+        if self.incremental:
+            conn = get_connection()
+            self.crawl_state = load_crawl_state(conn)
+            conn.close()
         
         with open('product_data.json', 'r', encoding='utf-8') as f:
             self.data = json.load(f)
-        
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        self.driver = webdriver.Chrome(options=chrome_options)
+
+        # (category, subcategory, product) to scrape, limited to the given
+        # categories and to this worker's shard of the product links
+        self.products = [
+            (category, subcategory, product)
+            for category, subcategories in self.data.items()
+            if not categories or category in categories
+            for subcategory, subcategory_data in subcategories.items()
+            for product in subcategory_data['products']
+            if shard is None or shard_of(product['link'], shards) == shard
+        ]
+        # Number of products to scrape, used for job progress
+        self.total = len(self.products)
         
         self.log_message("Spider initialized. Starting to scrape...")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(StockSpider, cls).from_crawler(crawler, *args, **kwargs)
+        # Screenshots are captured by a separate browser pool so parsing never waits on them
+        spider.screenshot_pool = ScreenshotPool(
+            workers=crawler.settings.getint('SCREENSHOT_WORKERS', 2),
+            timeout=crawler.settings.getint('SCREENSHOT_TIMEOUT', 3),
+            log=spider.log_message,
+            record=spider.record_timing
+        )
+        return spider
+
     def log_message(self, message):
         if self.message_queue:
             self.message_queue.put(message)
         self.logger.info(message)
 
-    def setup_database(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS product_info (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT,
-                subcategory TEXT,
-                product_name TEXT,
-                product_link TEXT UNIQUE
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS stock_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                date TEXT,
-                stock_amount INTEGER,
-                price REAL,
-                screenshot BLOB,
-                FOREIGN KEY (product_id) REFERENCES product_info (id)
-            )
-        ''')
-        self.conn.commit()
+    def record_timing(self, stage, url, seconds, status='ok', error=None, items=1):
+        if self.timings:
+            self.timings.record(stage, url, seconds, status, error, items)
 
     def start_requests(self):
-        for category, subcategories in self.data.items():
-            for subcategory, subcategory_data in subcategories.items():
-                for product in subcategory_data['products']:
-                    translate_url = f"{product['link']}"
-                    yield scrapy.Request(
-                        url=translate_url,
-                        callback=self.parse,
-                        meta={
-                            'category': category,
-                            'subcategory': subcategory,
-                            'product_name': product['Name'],
-                            'product_link': product['link']
-                        },
-                        dont_filter=True
-                    )
-
-    def take_screenshot(self, url):
-        self.driver.get(url)
-        time.sleep(2)  # Wait for the page to load
-        screenshot = self.driver.get_screenshot_as_png()
-        image = Image.open(io.BytesIO(screenshot))
-        image = image.convert('RGB')
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG', quality=70)
-        return img_byte_arr.getvalue()
+        for category, subcategory, product in self.products:
+            translate_url = f"{product['link']}"
+            meta = {
+                'category': category,
+                'subcategory': subcategory,
+                'product_name': product['Name'],
+                'product_link': product['link']
+            }
+            headers = {}
+            # Send conditional requests for products seen in an earlier crawl
+            if product['link'] in self.crawl_state:
+                etag, last_modified, content_hash = self.crawl_state[product['link']]
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+                meta['content_hash'] = content_hash
+                meta['handle_httpstatus_list'] = [304]
+            yield scrapy.Request(
+                url=translate_url,
+                callback=self.parse,
+                errback=self.request_failed,
+                headers=headers,
+                meta=meta,
+                dont_filter=True
+            )
 
     def parse(self, response):
         self.log_message(f"Started scraping: {response.url}")
+
+        if response.status == 304:
+            self.log_message(f"Not modified: {response.url}")
+            yield self.make_item(response, None, None, unchanged=True)
+            return
         
-        soup = BeautifulSoup(response.body, 'html.parser')
-        
-        # Extract stock number
-        text_div = soup.find('div', class_='text collapse')
-        stock = None
-        if text_div:
-            text_content = text_div.find('p').get_text(strip=True)
-            number_match = re.search(r'\b\d+\b', text_content)
-            if number_match:
-                stock = int(number_match.group(0))
-        
-        # Extract price
-        price_block = soup.find('div', class_='price-block')
-        price = None
-        if price_block:
-            price_span = price_block.find('span', class_='woocommerce-Price-amount amount')
-            if price_span:
-                price_text = price_span.get_text(strip=True)
-                price_match = re.search(r'[\d,]+(?:\.\d{2})?', price_text)
-                if price_match:
-                    price = float(price_match.group(0).replace(',', ''))
-
-        # Take screenshot
-        screenshot = self.take_screenshot(response.url)
-
-        # Insert or ignore product info
-        self.cursor.execute('''
-            INSERT OR IGNORE INTO product_info (category, subcategory, product_name, product_link)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            response.meta['category'],
-            response.meta['subcategory'],
-            response.meta['product_name'],
-            response.meta['product_link']
-        ))
-        
-        # Get the product_id
-        product_id = self.cursor.execute(
-            'SELECT id FROM product_info WHERE product_link = ?', (response.meta['product_link'],)
-        ).fetchone()[0]
-        
-        # Insert stock data, price, and screenshot
-        self.cursor.execute('''
-            INSERT INTO stock_data (product_id, date, stock_amount, price, screenshot)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (product_id, self.current_datetime, stock, price, sqlite3.Binary(screenshot)))
-        
-        self.conn.commit()
+        # Extract stock number and price with the site's selector rules
+        started = time.perf_counter()
+        fields = extract_fields(response)
+        self.record_timing('parse', response.url, time.perf_counter() - started)
+        stock = fields['stock']
+        price = fields['price']
 
         self.log_message(f"Finished scraping: {response.url}")
-        
-        yield {
+
+        # Skip the new row when the parsed stock and price match the last crawl
+        unchanged = self.incremental and response.meta.get('content_hash') == content_hash(stock, price)
+        yield self.make_item(response, stock, price, unchanged=unchanged)
+
+    # Requests that failed after their retries. Error responses were already
+    # recorded by the RunRecorder; connection errors and timeouts are
+    # recorded here as failed downloads.
+    def request_failed(self, failure):
+        url = failure.request.url
+        self.logger.error(f"Request failed: {url}: {failure.getErrorMessage()}")
+        if getattr(failure.value, 'response', None) is None:
+            self.record_timing(
+                'download', url, failure.request.meta.get('download_latency', 0.0), 'error',
+                failure.getErrorMessage() or repr(failure.value)
+            )
+
+    def make_item(self, response, stock, price, unchanged=False):
+        return {
             'category': response.meta['category'],
             'subcategory': response.meta['subcategory'],
             'product_name': response.meta['product_name'],
-            'product_link': response.url,
+            'product_link': response.meta['product_link'],
+            'url': response.url,
             'stock_amount': stock,
             'price': price,
-            'date': self.current_datetime
+            'date': self.current_datetime,
+            'unchanged': unchanged,
+            'content_hash': None if response.status == 304 else content_hash(stock, price),
+            'etag': response.headers.get('ETag', b'').decode('latin-1') or None,
+            'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1') or None
         }
 
+    # The pipeline bumps the version stamp when it closes, before the pool has
+    # attached the last screenshots, so bump it again once they are written
+    def finish_screenshots(self):
+        self.screenshot_pool.close()
+        if self.screenshot_pool.captured:
+            conn = get_connection()
+            set_last_scrape(conn)
+            conn.close()
+
     def closed(self, reason):
-        self.conn.close()
-        self.driver.quit()
-        self.log_message("Spider closed. All URLs have been scraped.")
-
-def run_spider(message_queue):
-    process = CrawlerProcess({
-        'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36',
-        'DOWNLOAD_DELAY': 2,
-        'CONCURRENT_REQUESTS': 1
-    })
-
-    process.crawl(StockSpider, message_queue=message_queue)
+        self.log_message("Waiting for screenshots to finish...")
+        # Drain the browser pool off the reactor thread
+        d = threads.deferToThread(self.finish_screenshots)
+        d.addCallback(lambda _: self.log_message("Spider closed. All URLs have been scraped."))
+        return d
+
+# A job cancelled while discovery ran stops there instead of going on to scrape
+def job_cancelled(job_id):
+    if not job_id:
+        return False
+    conn = get_connection()
+    try:
+        return get_status(conn, job_id) == 'cancelling'
+    finally:
+        conn.close()
+
+def run_spider(message_queue, profile='default', incremental=False, discover=False, job_id=None,
+               categories=None, shard=None, shards=1, scrape=True):
+    settings = get_crawl_settings(profile)
+    if job_id:
+        # Report progress into the crawl_jobs row and keep the job log readable
+        settings['JOB_ID'] = job_id
+        settings['LOG_LEVEL'] = 'INFO'
+    process = CrawlerProcess(settings)
+    stock_args = {
+        'message_queue': message_queue,
+        'incremental': incremental,
+        'categories': categories,
+        'shard': shard,
+        'shards': shards
+    }
+
+    if discover:
+        # Refresh product_data.json from the category listings before scraping stock
+        d = process.crawl(CatalogueSpider, message_queue=message_queue)
+        if scrape:
+            d.addCallback(lambda _: None if job_cancelled(job_id) else process.crawl(StockSpider, **stock_args))
+    else:
+        d = process.crawl(StockSpider, **stock_args)
+    # Raise a crawl that failed to start (e.g. a missing product_data.json)
+    failures = []
+    d.addErrback(failures.append)
     process.start()
+    if failures:
+        failures[0].raiseException()
+
+# Run a crawl job started by jobs.start_job and record how it ended
+def run_job(job_id, **options):
+    try:
+        run_spider(None, job_id=job_id, **options)
+    except Exception as e:
+        conn = get_connection()
+        finish_job(conn, job_id, 'failed', str(e))
+        conn.close()
+        raise
+    conn = get_connection()
+    status = 'cancelled' if get_status(conn, job_id) == 'cancelling' else 'finished'
+    finish_job(conn, job_id, status)
+    conn.close()
 
 if __name__ == "__main__":
-    run_spider(None)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape stock and price for every product in product_data.json.")
+    parser.add_argument('--profile', default='default', choices=list(CRAWL_PROFILES))
+    parser.add_argument('--incremental', action='store_true', help="Skip products that have not changed")
+    parser.add_argument('--discover', action='store_true', help="Refresh the catalogue from the listings first")
+    parser.add_argument('--discover-only', action='store_true', help="Refresh the catalogue without scraping stock")
+    parser.add_argument('--category', action='append', dest='categories', help="Only scrape this category (repeatable)")
+    parser.add_argument('--shard', type=int, help="Only scrape this shard of the products (0-based)")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shards the products are split into")
+    parser.add_argument('--job', type=int, help="crawl_jobs id to report progress to (set by jobs.start_job)")
+    args = parser.parse_args()
+    options = {
+        'profile': args.profile,
+        'incremental': args.incremental,
+        'discover': args.discover or args.discover_only,
+        'scrape': not args.discover_only,
+        'categories': args.categories,
+        'shard': args.shard,
+        'shards': args.shards
+    }
+    if args.job:
+        run_job(args.job, **options)
+    else:
+        run_spider(None, **options)
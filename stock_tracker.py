@@ -1,37 +1,17 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
-from PIL import Image
-import io
-
-# Connect to the SQLite database
-def get_connection():
-    return sqlite3.connect('product_database.db', check_same_thread=False)
-
-conn = get_connection()
-
-# Function to load data from the database
-def load_data():
-    query = """
-    SELECT pi.category, pi.subcategory, pi.product_name, sd.price, sd.date, sd.stock_amount, sd.id as stock_id
-    FROM product_info pi
-    JOIN stock_data sd ON pi.id = sd.product_id
-    """
-    df = pd.read_sql_query(query, conn)
-    df['date'] = pd.to_datetime(df['date'])
-    return df
+from data_access import (
+    data_version, load_products, load_date_bounds, load_product_history, load_history, load_screenshot,
+    load_screenshot_data, load_thumbnails
+)
+
+THUMBNAILS_PER_PAGE = 8
+THUMBNAIL_COLUMNS = 4
 
 # Function to get screenshot from the database
 def get_screenshot(stock_id):
-    stock_id = int(stock_id)
-    cursor = conn.cursor()
-    cursor.execute("SELECT screenshot FROM stock_data WHERE id = ?", (stock_id,))
-    result = cursor.fetchone()
-    if result:
-        return result[0]
-    return None
+    return load_screenshot(stock_id)
 
 # Function to format stock difference
 def format_stock_difference(value):
@@ -44,34 +24,38 @@ def format_stock_difference(value):
         return "0"
 
 def main():
-    # Load the data
-    df = load_data()
+    # Results are cached until the next scrape finishes
+    version = data_version()
+    products_df = load_products(version)
 
     st.title('Product Stock Tracker')
 
+    if products_df.empty:
+        st.warning('No data available. Please run the scraper to collect data.')
+        return
+
     # Sidebar filters
     st.sidebar.header('Filters')
 
     # Sort categories by maximum stock amount, descending
-    category_stock = df.groupby('category')['stock_amount'].max().sort_values(ascending=False)
+    category_stock = products_df.groupby('category')['max_stock'].max().sort_values(ascending=False)
     categories = category_stock.index.tolist()
     selected_category = st.sidebar.selectbox('Select Category', categories)
 
     # Filter and sort subcategories
-    subcategory_df = df[df['category'] == selected_category]
-    subcategory_stock = subcategory_df.groupby('subcategory')['stock_amount'].max().sort_values(ascending=False)
+    subcategory_df = products_df[products_df['category'] == selected_category]
+    subcategory_stock = subcategory_df.groupby('subcategory')['max_stock'].max().sort_values(ascending=False)
     subcategories = subcategory_stock.index.tolist()
     selected_subcategory = st.sidebar.selectbox('Select Subcategory', subcategories)
 
     # Filter and sort products
     product_df = subcategory_df[subcategory_df['subcategory'] == selected_subcategory]
-    product_stock = product_df.groupby('product_name')['stock_amount'].max().sort_values(ascending=False)
+    product_stock = product_df.groupby('product_name')['max_stock'].max().sort_values(ascending=False)
     products = product_stock.index.tolist()
     selected_product = st.sidebar.selectbox('Select Product', products)
 
     # Date range filter
-    min_date = df['date'].min().date()
-    max_date = df['date'].max().date()
+    min_date, max_date = load_date_bounds(version)
 
     # Ensure the default dates are within the available range
     default_start_date = max(min_date, max_date - timedelta(days=30))
@@ -85,12 +69,8 @@ def main():
         st.sidebar.error('Error: End date must fall after start date.')
         st.stop()
 
-    # Filter the dataframe based on selections
-    filtered_df = df[(df['category'] == selected_category) & 
-                     (df['subcategory'] == selected_subcategory) & 
-                     (df['product_name'] == selected_product) & 
-                     (df['date'].dt.date >= start_date) & 
-                     (df['date'].dt.date <= end_date)]
+    # Load only the selected product's rows in the date range
+    filtered_df = load_product_history(version, selected_category, selected_subcategory, selected_product, start_date, end_date)
 
     # Sort the dataframe by date
     filtered_df = filtered_df.sort_values('date')
@@ -126,6 +106,18 @@ def main():
         
         st.dataframe(display_df[['date', 'stock_amount', 'stock_change', 'price']], width=800)
 
+        # Bulk export of the whole subcategory; archived months are read from
+        # Parquet, so long ranges do not scan stock_data
+        with st.expander('Export Subcategory History'):
+            if st.button('Prepare CSV'):
+                history = load_history(version, start_date, end_date, selected_category, selected_subcategory)
+                st.caption(f"{len(history)} rows for {selected_subcategory} from {start_date} to {end_date}")
+                st.download_button(
+                    'Download CSV', history.to_csv(index=False).encode('utf-8'),
+                    file_name=f"{selected_category}_{selected_subcategory}_{start_date}_{end_date}.csv",
+                    mime='text/csv'
+                )
+
         # Display current stock, price, and change from previous record
         if len(filtered_df) > 1:
             current_stock = int(filtered_df['stock_amount'].iloc[-1])
@@ -142,20 +134,47 @@ def main():
             col2.metric("Previous Stock", previous_stock)
             col3.metric("Current Price", f"${current_price:.2f}", delta=f"${price_change:.2f}")
 
-        # Screenshot viewer
+        # Screenshot viewer: a paged strip of thumbnails for the date range.
+        # Only the visible page's thumbnails are read, and a full image is
+        # fetched only when it is opened.
         st.subheader("Screenshot Viewer")
-        selected_date = st.selectbox("Select a date to view the screenshot", options=display_df['date'])
-        selected_stock_id = display_df[display_df['date'] == selected_date]['stock_id'].values[0]
-
-        screenshot_data = get_screenshot(selected_stock_id)
-        if screenshot_data:
-            try:
-                image = Image.open(io.BytesIO(screenshot_data))
-                st.image(image, caption=f"Screenshot from {selected_date}", use_column_width=True)
-            except Exception as e:
-                st.error(f"Error displaying image: {str(e)}")
+        # Carried-forward rows repeat an earlier capture; keep its own date
+        captures = filtered_df[filtered_df['screenshot_hash'].notna()].drop_duplicates('stock_id')
+        captures = captures.sort_values('date', ascending=False)
+        if captures.empty:
+            st.warning("No screenshots available for the selected date range.")
         else:
-            st.warning("No screenshot available for the selected date.")
+            pages = (len(captures) - 1) // THUMBNAILS_PER_PAGE + 1
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+            visible = captures.iloc[(page - 1) * THUMBNAILS_PER_PAGE:page * THUMBNAILS_PER_PAGE]
+            thumbnails = load_thumbnails(tuple(digest for digest in visible['screenshot_hash'] if digest))
+
+            columns = st.columns(THUMBNAIL_COLUMNS)
+            for i, capture in enumerate(visible.itertuples()):
+                with columns[i % THUMBNAIL_COLUMNS]:
+                    label = capture.date.strftime('%Y-%m-%d %H:%M')
+                    if capture.screenshot_hash in thumbnails:
+                        st.image(thumbnails[capture.screenshot_hash], caption=label)
+                    else:
+                        st.caption(label)
+                    if st.button("View", key=f"screenshot_{capture.stock_id}"):
+                        st.session_state['screenshot_stock_id'] = int(capture.stock_id)
+
+            selected = captures[captures['stock_id'] == st.session_state.get('screenshot_stock_id')]
+            if not selected.empty:
+                capture = selected.iloc[0]
+                selected_date = capture['date'].strftime('%Y-%m-%d %H:%M:%S')
+                if capture['screenshot_hash']:
+                    screenshot_data = load_screenshot_data(capture['screenshot_hash'])
+                else:
+                    screenshot_data = get_screenshot(capture['stock_id'])
+                if screenshot_data:
+                    try:
+                        st.image(screenshot_data, caption=f"Screenshot from {selected_date}")
+                    except Exception as e:
+                        st.error(f"Error displaying image: {str(e)}")
+                else:
+                    st.warning("No screenshot available for the selected date.")
 
     else:
         st.warning('No data available for the selected filters.')